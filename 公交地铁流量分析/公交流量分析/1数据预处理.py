@@ -8,39 +8,31 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 import os
 
+from 数据入库 import BUSGPS_PARQUET, ingest_busgps, read_busgps
+from 数据清洗 import clean_outofbuffer, clean_same
+from 地图匹配 import LineMatcher, map_match_lines
+
 # 设置 Matplotlib 显示中文和负号
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['font.serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
 
+# 地图匹配的距离阈值（米），超过该距离的坐标点视为偏离线路
+MATCH_DISTANCE = 200
+
 # 创建“图片”文件夹
 if not os.path.exists("图片"):
     os.makedirs("图片")
-def clean_same(df, col):
-    df = df.sort_values(by=['VehicleId', 'GPSDateTime']).reset_index(drop=True)
-    check_cols = [c for c in col if c != 'GPSDateTime']
-    keep_indices = []
-    for _, group in df.groupby('VehicleId'):
-        group['diff'] = group[check_cols].ne(group[check_cols].shift()).any(axis=1)
-        group['block'] = (group['diff'] | group['diff'].shift(fill_value=True)).cumsum()
-        for _, block in group.groupby('block'):
-            if len(block) > 1:
-                keep_indices.extend([block.index[0], block.index[-1]])
-            else:
-                keep_indices.append(block.index[0])
-    return df.loc[sorted(set(keep_indices))].drop(columns=['diff', 'block'], errors='ignore')
 # 设置 matplotlib 的中文显示
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['font.serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
 
-# 读取 GPS 数据
-BUS_GPS = pd.read_csv(r'data/busgps.csv', header=None)
-BUS_GPS.columns = ['GPSDateTime', 'LineId', 'LineName', 'NextLevel', 'PrevLevel',
-                   'Strlatlon', 'ToDir', 'VehicleId', 'VehicleNo', 'unknow']
-
-# 时间转换为 datetime 格式
-BUS_GPS['GPSDateTime'] = pd.to_datetime(BUS_GPS['GPSDateTime'])
+# 读取 GPS 数据（首次运行时先将 CSV 分块解析入库，坐标已转换为 WGS84）
+if not os.path.exists(BUSGPS_PARQUET):
+    ingest_busgps(r'data/busgps.csv', BUSGPS_PARQUET)
+BUS_GPS = read_busgps(BUSGPS_PARQUET, columns=['GPSDateTime', 'LineId', 'LineName', 'NextLevel', 'PrevLevel',
+                                               'ToDir', 'VehicleId', 'VehicleNo', 'lon', 'lat'])
 
 # 读取公交线数据
 shp = r'data/busline.json'
@@ -50,12 +42,6 @@ line = gpd.GeoDataFrame.from_file(shp, encoding='utf-8')
 shp = r'data/busstop.json'
 stop = gpd.GeoDataFrame.from_file(shp, encoding='utf-8')
 
-# 切分经纬度的字符串
-BUS_GPS['lon'] = BUS_GPS['Strlatlon'].apply(lambda r: r.split(',')[0])
-BUS_GPS['lat'] = BUS_GPS['Strlatlon'].apply(lambda r: r.split(',')[1])
-# 坐标系转换
-BUS_GPS['lon'], BUS_GPS['lat'] = tbd.gcj02towgs84(BUS_GPS['lon'].astype(float), BUS_GPS['lat'].astype(float))
-
 # 一辆车在一个时刻只保留一条记录
 BUS_GPS_clean = BUS_GPS.drop_duplicates(subset=['VehicleId', 'GPSDateTime'])
 
@@ -101,32 +87,24 @@ BUS_GPS_clean_2416 = BUS_GPS_clean.to_crs(epsg=2416)
 # 转换坐标系为投影坐标系，方便后面计算距离
 line.crs = {'init': 'epsg:4326'}
 line_2416 = line.to_crs(epsg=2416)
-# 公交线路数据里面的 geometry
-lineshp = line_2416['geometry'].iloc[0]
-linename = line_2416['name'].iloc[0]
-
-# 利用 project 方法，将数据点投影至公交线路上
-BUS_GPS_clean_2416['project'] = BUS_GPS_clean_2416['geometry'].apply(lambda r: lineshp.project(r))
-# 原始的坐标点存储在一个字段中
-BUS_GPS_clean_2416['geometry_orgin'] = BUS_GPS_clean_2416['geometry']
-# 利用 interpolate 方法，生成匹配的坐标点
-BUS_GPS_clean_2416['geometry'] = BUS_GPS_clean_2416['project'].apply(lambda r: lineshp.interpolate(r))
-# 计算原始点和匹配点之间的距离
-BUS_GPS_clean_2416['diff'] = BUS_GPS_clean_2416.apply(lambda r: r['geometry_orgin'].distance(r['geometry']), axis=1)
+# 对所有公交线路（含上下行）建立空间索引，线路数据中有 LineId、ToDir 列时用于约束候选线路
+matcher = LineMatcher(line_2416)
+
+# 地图匹配：每个数据点匹配至 MATCH_DISTANCE 米内最近的公交线路，生成匹配点（geometry）与所属线路（linename），
+# 原始的坐标点存储在 geometry_orgin 字段中，diff 为原始点和匹配点之间的距离；
+# 距离阈值直接作为匹配半径，半径内没有线路的坐标点在匹配时即被剔除
+BUS_GPS_clean_2416 = map_match_lines(BUS_GPS_clean_2416, matcher, radius=MATCH_DISTANCE)
 
 # 绘制距离分布的核密度分布
 fig = plt.figure(figsize=(7, 4), dpi=250)
 ax1 = plt.subplot(111)
-sns.kdeplot(BUS_GPS_clean_2416[BUS_GPS_clean_2416['diff'] < 1000]['diff'])
-plt.xticks(range(0, 1000, 100), range(0, 1000, 100))
+sns.kdeplot(BUS_GPS_clean_2416['diff'])
+plt.xticks(range(0, MATCH_DISTANCE + 1, 20), range(0, MATCH_DISTANCE + 1, 20))
 plt.ylabel('概率密度分布')
 plt.xlabel('距离(米)')
 plt.savefig('图片/距离核密度分布图.svg', format='svg', bbox_inches='tight')
 plt.close()
 
-# 只筛选保留距离公交线路 200 米内的坐标点
-BUS_GPS_clean_2416 = BUS_GPS_clean_2416[BUS_GPS_clean_2416['diff'] < 200]
-
 # 地图匹配后的匹配点
 fig = plt.figure(figsize=(7, 4), dpi=250)
 ax = plt.subplot(111)
@@ -156,8 +134,10 @@ line_buffer.plot(ax=ax)
 plt.savefig('图片/线路缓冲区示意图.svg', format='svg', bbox_inches='tight')
 plt.close()
 
-# tbd.clean_outofshape 方法剔除公交线路缓冲区范围外的数据
-BUS_GPS_clean_2 = tbd.clean_outofshape(BUS_GPS_clean, line_buffer, col=['lon', 'lat'], accuracy=100)
+# 剔除公交线路缓冲区范围外的数据（在投影坐标系下精确判断），并统计各线路剔除的记录数
+BUS_GPS_clean_2, dropped = clean_outofbuffer(BUS_GPS_clean, line_2416, distance=200, col=['lon', 'lat'])
+print("各线路剔除的缓冲区外记录数：")
+print(dropped)
 
 # 绘制清理后的数据
 fig = plt.figure(figsize=(7, 4), dpi=250)
@@ -2,15 +2,23 @@ import warnings
 warnings.filterwarnings("ignore")
 import pandas as pd
 import geopandas as gpd
-import transbigdata as tbd
 import matplotlib.pyplot as plt
 import os
 
+from 地图匹配 import LineMatcher, hmm_match, project_points
+from 行程分析 import segment_trips
+from 轨迹存储 import TrajectoryStore
+from 运行图绘制 import draw_lines, draw_raster, trajectory_raster
+
 # 设置 Matplotlib 显示中文和负号
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['font.serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
 
+# 多车运行图的绘制方式：'raster' 为密度栅格，'lines' 为单个 LineCollection，二者输出 PNG；
+# 'plot' 为逐车调用 plt.plot 并输出 SVG（车辆多时文件很大）
+RENDER_MODE = 'raster'
+
 # 创建图片保存目录
 if not os.path.exists('图片'):
     os.makedirs('图片')
@@ -29,9 +37,12 @@ linename = line_2416['name'].iloc[0]
 # 读取 GPS 数据
 BUS_GPS_clean = gpd.read_file('BUS_GPS_clean.geojson')
 BUS_GPS_clean_2416 = BUS_GPS_clean.to_crs(epsg=2416)
-BUS_GPS = BUS_GPS_clean_2416.copy()
-# 为 GPS 数据生成 project 列
-BUS_GPS['project'] = BUS_GPS['geometry'].apply(lambda r: lineshp.project(r))
+# 轨迹地图匹配：在线路的上下行之间用 HMM 选出连贯的匹配位置，避免共线、折返路段匹配错误
+BUS_GPS = hmm_match(BUS_GPS_clean_2416, LineMatcher(line_2416), radius=200)
+# 运行图以第一条线路为纵轴，匹配到其他方向的点换算为匹配点在该线路上的位置，生成 project 列
+other_dir = (BUS_GPS['line_index'] != 0).to_numpy()
+BUS_GPS.loc[other_dir, 'project'] = project_points(
+    lineshp, BUS_GPS.geometry.x[other_dir], BUS_GPS.geometry.y[other_dir])
 
 # 设定分析的时间范围
 start_time = pd.to_datetime('2019-01-17 08:30:00')
@@ -93,7 +104,7 @@ stop.crs = {'init': 'epsg:4326'}
 stop = stop.to_crs(epsg=2416)
 
 # 地图匹配
-stop['project'] = stop['geometry'].apply(lambda r: lineshp.project(r))
+stop['project'] = project_points(lineshp, stop.geometry.x, stop.geometry.y)
 stop = stop[stop['linename'] == linename]
 
 # 站点信息
@@ -166,58 +177,66 @@ if len(selected_vehicle_data) >= 2:  # 至少需要2个点才能画线
 else:
     print("错误: 没有足够的数据点绘制单车运行图")
 
-# 绘制所有车的运行图 (限定时间范围)
-fig = plt.figure(1, (10, 8), dpi=250)
-ax1 = plt.subplot(111)
+# 绘制多车运行图：站点位置线一次绘制，轨迹按 RENDER_MODE 选择绘制方式
+def draw_run_diagram(store, title, filename, start_time, end_time):
+    fig = plt.figure(1, (10, 8), dpi=250)
+    ax1 = plt.subplot(111)
 
-# 灰色线标注站点位置
-for i in range(len(stop)):
-    project = stop['project'].iloc[i]
-    stopname = stop['stopname'].iloc[i]
-    plt.plot([start_time, end_time],
-             [project, project], 'k--', lw=0.2)
+    # 灰色线标注站点位置
+    ax1.hlines(stop['project'], start_time, end_time, colors='k', linestyles='--', lw=0.2)
 
-# 每辆车绘制一条运行图的曲线
-vehicle_count = 0
-for Vehicle in BUS_GPS_time_filtered['VehicleId'].drop_duplicates():
-    vehicle_data = BUS_GPS_time_filtered[BUS_GPS_time_filtered['VehicleId'] == Vehicle]
-    if len(vehicle_data) >= 2:  # 至少需要2个点才能画线
-        plt.plot(vehicle_data['GPSDateTime'], vehicle_data['project'], linewidth=1, alpha=0.7)
-        vehicle_count += 1
+    if RENDER_MODE == 'raster':
+        raster, distance_range = trajectory_raster(store, 'project', start_time, end_time)
+        draw_raster(ax1, raster, start_time, end_time, distance_range)
+    elif RENDER_MODE == 'lines':
+        draw_lines(ax1, store, 'project', start_time, end_time)
+    else:
+        # 每辆车绘制一条运行图的曲线
+        for Vehicle in store.keys:
+            times, project = store.get(Vehicle, 'project', start_time, end_time)
+            if len(times) >= 2:  # 至少需要2个点才能画线
+                plt.plot(times, project, linewidth=1, alpha=0.7)
 
-print(f"指定时间范围内有足够数据的车辆数: {vehicle_count}")
+    # 标记站点名字
+    plt.yticks(stop['project'], stop['stopname'])
 
-# 标记站点名字
-plt.yticks(stop['project'], stop['stopname'])
+    # 设定时间范围
+    plt.xlim(start_time, end_time)
 
-# 设定时间范围
-plt.xlim(start_time, end_time)
+    # 添加轴标签和标题
+    plt.xlabel('时间', fontsize=12)
+    plt.ylabel('站点位置', fontsize=12)
+    plt.title(title, fontsize=14)
 
-# 添加轴标签和标题
-plt.xlabel('时间', fontsize=12)
-plt.ylabel('站点位置', fontsize=12)
-plt.title(f'所有车辆运行轨迹 ({start_time.strftime("%H:%M")} - {end_time.strftime("%H:%M")})', fontsize=14)
+    # 格式化x轴日期显示
+    plt.gcf().autofmt_xdate()
 
-# 格式化x轴日期显示
-plt.gcf().autofmt_xdate()
+    plt.tight_layout()
+    if RENDER_MODE == 'plot':
+        plt.savefig(f'图片/{filename}.svg', format='svg', bbox_inches='tight')
+    else:
+        plt.savefig(f'图片/{filename}.png', format='png', bbox_inches='tight')
+    plt.close()
 
-plt.tight_layout()
-plt.savefig('图片/所有车辆运行轨迹图.svg', format='svg', bbox_inches='tight')  # 原文件名: all_vehicles_run.svg
-plt.close()
 
-# 对车辆重新编号
-BUS_GPS['GPSDateTime1'] = BUS_GPS['GPSDateTime'].shift()
-BUS_GPS['VehicleId1'] = BUS_GPS['VehicleId'].shift()
-# 如果时间间隔大于30分钟，则认为是新的车
-duration = 30 * 60
-BUS_GPS['flag'] = ((BUS_GPS['VehicleId1'] != BUS_GPS['VehicleId']) |
-                   ((BUS_GPS['GPSDateTime'] - BUS_GPS['GPSDateTime1']).dt.total_seconds() > 
-                   duration)).astype(int)
-# 重新编号
-BUS_GPS['VehicleId_new'] = BUS_GPS['flag'].cumsum()
+# 按车辆连续存储轨迹，取单车数据与时间窗查询都是数组切片，不再每辆车扫描整张表
+store = TrajectoryStore(BUS_GPS, 'VehicleId', 'GPSDateTime', ['project'])
 
-# 使用 transbigdata 重新编号
-BUS_GPS_reindex = tbd.id_reindex(BUS_GPS, 'VehicleId', timegap=1800, timecol='GPSDateTime')
+# 统计指定时间范围内有足够数据的车辆数
+vehicle_count = 0
+for Vehicle in store.keys:
+    start, end = store.window(Vehicle, start_time, end_time)
+    if end - start >= 2:  # 至少需要2个点才能画线
+        vehicle_count += 1
+print(f"指定时间范围内有足够数据的车辆数: {vehicle_count}")
+
+# 绘制所有车的运行图 (限定时间范围)
+draw_run_diagram(store, f'所有车辆运行轨迹 ({start_time.strftime("%H:%M")} - {end_time.strftime("%H:%M")})',
+                 '所有车辆运行轨迹图', start_time, end_time)
+
+# 对车辆重新编号：时间间隔大于30分钟，或在终点掉头（沿线行驶方向反转），则认为是新的行程
+BUS_GPS_reindex = segment_trips(BUS_GPS, 'VehicleId', 'GPSDateTime', 'project', timegap=30 * 60,
+                                trip_col='VehicleId_new', direction_col='direction')
 
 # 筛选指定时间范围内的数据
 BUS_GPS_reindex_time_filtered = BUS_GPS_reindex[
@@ -225,48 +244,14 @@ BUS_GPS_reindex_time_filtered = BUS_GPS_reindex[
     (BUS_GPS_reindex['GPSDateTime'] <= end_time)
 ]
 
-# 绘制重新编号后的所有车的运行图
-fig = plt.figure(1, (10, 8), dpi=250)
-ax1 = plt.subplot(111)
-
-# 灰色线标注站点位置
-for i in range(len(stop)):
-    project = stop['project'].iloc[i]
-    stopname = stop['stopname'].iloc[i]
-    plt.plot([start_time, end_time],
-             [project, project], 'k--', lw=0.2)
-
-# 每辆车绘制一条运行图的曲线
-vehicle_count = 0
-for Vehicle in BUS_GPS_reindex_time_filtered['VehicleId_new'].drop_duplicates():
-    vehicle_data = BUS_GPS_reindex_time_filtered[
-        BUS_GPS_reindex_time_filtered['VehicleId_new'] == Vehicle
-    ]
-    if len(vehicle_data) >= 2:  # 至少需要2个点才能画线
-        plt.plot(vehicle_data['GPSDateTime'], vehicle_data['project'], linewidth=1, alpha=0.7)
-        vehicle_count += 1
-
+# 按重新编号后的车辆连续存储轨迹
+store_reindex = TrajectoryStore(BUS_GPS_reindex_time_filtered, 'VehicleId_new', 'GPSDateTime', ['project'])
+vehicle_count = int((store_reindex.counts() >= 2).sum())
 print(f"重新编号后指定时间范围内有足够数据的车辆数: {vehicle_count}")
 
-# 标记站点名字
-plt.yticks(stop['project'], stop['stopname'])
-
-# 设定时间范围
-plt.xlim(start_time, end_time)
-
-# 添加轴标签和标题
-plt.xlabel('时间', fontsize=12)
-plt.ylabel('站点位置', fontsize=12)
-plt.title(f'重新编号后所有车辆运行轨迹 ({start_time.strftime("%H:%M")} - {end_time.strftime("%H:%M")})', 
-          fontsize=14)
-
-# 格式化x轴日期显示
-plt.gcf().autofmt_xdate()
-
-plt.tight_layout()
-plt.savefig('图片/重新编号后所有车辆运行轨迹图.svg', format='svg', bbox_inches='tight')  # 原文件名: all_vehicles_reindexed_run.svg
-plt.close()
-
-print("图表绘制完成，请查看'图片'文件夹中的SVG文件。")
-
+# 绘制重新编号后的所有车的运行图
+draw_run_diagram(store_reindex,
+                 f'重新编号后所有车辆运行轨迹 ({start_time.strftime("%H:%M")} - {end_time.strftime("%H:%M")})',
+                 '重新编号后所有车辆运行轨迹图', start_time, end_time)
 
+print("图表绘制完成，请查看'图片'文件夹中的图片文件。")
@@ -2,11 +2,15 @@ import os
 import geopandas as gpd
 import matplotlib.pyplot as plt
 import pandas as pd
-import seaborn as sns
-import transbigdata as tbd
 import warnings
 import matplotlib as mpl
 
+from 数据入库 import BUSGPS_PARQUET, ingest_busgps, read_busgps
+from 数据清洗 import clean_same
+from 地图匹配 import LineMatcher, hmm_match, project_stops
+from 行程分析 import arrive_info, segment_trips
+from 运营指标 import boxplot_stats, onewaytime_batch, route_terminals
+
 # 设置 Matplotlib 显示中文和负号
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['font.serif'] = ['SimHei']
@@ -28,18 +32,10 @@ mpl.rcParams['font.family'] = 'sans-serif'
 # 创建图片保存目录
 os.makedirs("图片", exist_ok=True)
 
-# 读取数据
-BUS_GPS = pd.read_csv(r'data/busgps.csv', header=None)
-BUS_GPS.columns = ['GPSDateTime', 'LineId', 'LineName', 'NextLevel', 'PrevLevel',
-                   'Strlatlon', 'ToDir', 'VehicleId', 'VehicleNo', 'unknow']
-# 时间转换为datetime格式
-BUS_GPS['GPSDateTime'] = pd.to_datetime(BUS_GPS['GPSDateTime'])
-
-# 切分经纬度的字符串
-BUS_GPS['lon'] = BUS_GPS['Strlatlon'].apply(lambda r: r.split(',')[0])
-BUS_GPS['lat'] = BUS_GPS['Strlatlon'].apply(lambda r: r.split(',')[1])
-# 坐标系转换
-BUS_GPS['lon'], BUS_GPS['lat'] = tbd.gcj02towgs84(BUS_GPS['lon'].astype(float), BUS_GPS['lat'].astype(float))
+# 读取数据（首次运行时先将 CSV 分块解析入库，坐标已转换为 WGS84），只读取到站计算需要的列
+if not os.path.exists(BUSGPS_PARQUET):
+    ingest_busgps(r'data/busgps.csv', BUSGPS_PARQUET)
+BUS_GPS = read_busgps(BUSGPS_PARQUET, columns=['GPSDateTime', 'VehicleId', 'lon', 'lat'])
 
 # 读取公交线路数据
 shp = r'data/busline.json'
@@ -54,8 +50,8 @@ plt.close(fig1)
 
 # 读取公交站点数据
 shp = r'data/busstop.json'
-stop = gpd.GeoDataFrame.from_file(shp, encoding='utf-8')
-stop = stop[stop['linename'] == '71路(延安东路外滩-申昆路枢纽站)']
+stop_all = gpd.GeoDataFrame.from_file(shp, encoding='utf-8')
+stop = stop_all[stop_all['linename'] == '71路(延安东路外滩-申昆路枢纽站)']
 # 第二张图: 站点图
 fig2, ax2 = plt.subplots(figsize=(8, 4), dpi=250)
 stop.plot(ax=ax2)
@@ -63,73 +59,79 @@ plt.title('公交站点图')
 plt.savefig("图片/公交站点图.svg", format="svg")
 plt.close(fig2)
 
-# 计算到站信息
-arriveinfo = tbd.busgps_arriveinfo(BUS_GPS, line, stop)
-
-# 根据函数签名正确调用，只传递前三个必要参数，让col使用默认值
-onewaytime = tbd.busgps_onewaytime(
-    arriveinfo,          # 第一个参数是arrive_info
-    '延安东路外滩',      # 第二个参数是start
-    '申昆路枢纽站'       # 第三个参数是end
-)
-
-# 打印列名和前几行数据，以便了解数据结构
-print("onewaytime列名:", onewaytime.columns.tolist())
-print("onewaytime前5行:", onewaytime.head())
-
-# 检查是否有方向相关的列
-direction_column = 'direction'  # 默认方向列名，可能需要修改
-if 'direction' in onewaytime.columns:
-    direction_column = 'direction'
-elif 'dir' in onewaytime.columns:
-    direction_column = 'dir'
-elif 'Direction' in onewaytime.columns:
-    direction_column = 'Direction'
-elif '方向' in onewaytime.columns:
-    direction_column = '方向'
-else:
-    # 如果没有找到方向列，创建一个默认方向列
-    print("未找到方向列，创建默认方向")
-    onewaytime['direction'] = '前往' + onewaytime['endstop']
-    direction_column = 'direction'
-
-# 设置中文字体
-plt.rcParams['font.sans-serif'] = ['SimHei']
-plt.rcParams['font.serif'] = ['SimHei']
-plt.rcParams['axes.unicode_minus'] = False
-
-# 第三张图: 耗时分布箱型图
-fig3 = plt.figure(figsize=(8, 4), dpi=250)
-ax3 = plt.subplot(111)
-sns.boxplot(x='shour', y=onewaytime['duration'] / 60, hue=direction_column, data=onewaytime, ax=ax3)
-plt.ylabel('始发站至终点站耗时（分钟）')
-plt.xlabel('小时')
-plt.ylim(0)
-plt.title('公交耗时分布')
-plt.savefig("图片/公交耗时分布.svg", format="svg")
-plt.close(fig3)
-
-# 转换坐标系为投影坐标系，方便后面计算距离
-line.crs = {'init': 'epsg:4326'}
-line_2416 = line.to_crs(epsg=2416)
-# 公交线路数据里面的geometry
-lineshp = line_2416['geometry'].iloc[0]
-linename = line_2416['name'].iloc[0]
-
-# 筛选去掉车速过快的
-# 车速单位转换为km/h
-onewaytime['speed'] = (lineshp.length/onewaytime['duration'])*3.6
-onewaytime = onewaytime[onewaytime['speed'] <= 60]
-
-# 第四张图: 车速分布
-fig4 = plt.figure(figsize=(8, 4), dpi=250)
-ax4 = plt.subplot(111)
-sns.boxplot(x='shour', y='speed', hue=direction_column, data=onewaytime, ax=ax4)
-plt.ylabel('运营速度（km/h）')
-plt.xlabel('小时')
-plt.ylim(0)
-plt.title('公交车速分布')
-plt.savefig("图片/公交车速分布.svg", format="svg")
-plt.close(fig4)
-
-print("所有图片已保存到'图片'文件夹中")
\ No newline at end of file
+# 计算到站信息：所有线路、所有车辆一次性完成地图匹配、行程划分与到站识别
+# 剔除静止冗余记录，转换为投影坐标后匹配到各条线路（上下行分别为一条线路）
+BUS_GPS = clean_same(BUS_GPS, col=['VehicleId', 'GPSDateTime', 'lon', 'lat'])
+BUS_GPS = gpd.GeoDataFrame(BUS_GPS, geometry=gpd.points_from_xy(BUS_GPS['lon'], BUS_GPS['lat']), crs='EPSG:4326')
+linegdf.crs = {'init': 'epsg:4326'}
+linegdf_2416 = linegdf.to_crs(epsg=2416)
+BUS_GPS = hmm_match(BUS_GPS.to_crs(epsg=2416), LineMatcher(linegdf_2416), radius=200)
+# 按时间间隔、行驶方向与匹配线路的变化划分行程
+BUS_GPS = segment_trips(BUS_GPS, 'VehicleId', 'GPSDateTime', 'project', timegap=30*60, line_col='linename')
+# 站点投影至所属线路，计算各行程经过每个站点的到站、离站时间
+stop_all.crs = {'init': 'epsg:4326'}
+stop_project = project_stops(stop_all.to_crs(epsg=2416), linegdf_2416)
+arriveinfo = arrive_info(BUS_GPS, stop_project, stopbuffer=200, stop_id_col='stop_index')
+print(f"到站识别完成：{arriveinfo['linename'].nunique()} 条线路，{len(arriveinfo)} 条到站记录")
+# 保存到站表，供车头时距分析等后续步骤使用
+arriveinfo.to_parquet(r'data/arriveinfo.parquet', index=False)
+
+# 所有线路、方向的起终点站与线路长度
+terminals = route_terminals(stop_project, linegdf_2416)
+
+# 批量计算单程耗时与运营速度
+onewaytime = onewaytime_batch(arriveinfo, terminals)
+print(f"单程记录 {len(onewaytime)} 条")
+
+# 按线路、方向、小时汇总分位数：耗时使用全部单程，车速去掉车速过快（超过 60 km/h）的异常单程
+duration_stats = boxplot_stats(onewaytime.assign(duration=onewaytime['duration'] / 60), 'duration')
+speed_stats = boxplot_stats(onewaytime[onewaytime['speed'] <= 60], 'speed')
+duration_stats.to_csv(r'data/onewaytime_duration_stats.csv', index=False, encoding='utf-8-sig')
+speed_stats.to_csv(r'data/onewaytime_speed_stats.csv', index=False, encoding='utf-8-sig')
+
+
+# 用汇总好的分位数绘制按小时、方向分组的箱型图
+def draw_boxplot(ax, stats, directions):
+    width = 0.8 / len(directions)
+    for k, (linename, direction) in enumerate(directions):
+        d = stats[stats['linename'] == linename]
+        boxes = [{'med': r.med, 'q1': r.q1, 'q3': r.q3, 'whislo': r.whislo, 'whishi': r.whishi,
+                  'mean': r.mean, 'fliers': []} for r in d.itertuples()]
+        positions = d['shour'].to_numpy() + (k - (len(directions) - 1) / 2) * width
+        artists = ax.bxp(boxes, positions=positions, widths=width * 0.9, patch_artist=True,
+                         showfliers=False, manage_ticks=False)
+        for box in artists['boxes']:
+            box.set_facecolor(f'C{k}')
+        if artists['boxes']:
+            artists['boxes'][0].set_label(direction)
+    ax.legend()
+
+
+# 每条公交线路一组图：耗时分布、车速分布，上下行用不同颜色区分
+terminals['route'] = terminals['linename'].str.split('(').str[0]
+for route, route_lines in terminals.groupby('route'):
+    directions = list(zip(route_lines['linename'], route_lines['startstop'] + '-' + route_lines['endstop']))
+
+    # 第三张图: 耗时分布箱型图
+    fig3 = plt.figure(figsize=(8, 4), dpi=250)
+    ax3 = plt.subplot(111)
+    draw_boxplot(ax3, duration_stats, directions)
+    plt.ylabel('始发站至终点站耗时（分钟）')
+    plt.xlabel('小时')
+    plt.ylim(0)
+    plt.title(f'{route}公交耗时分布')
+    plt.savefig(f"图片/{route}公交耗时分布.svg", format="svg")
+    plt.close(fig3)
+
+    # 第四张图: 车速分布
+    fig4 = plt.figure(figsize=(8, 4), dpi=250)
+    ax4 = plt.subplot(111)
+    draw_boxplot(ax4, speed_stats, directions)
+    plt.ylabel('运营速度（km/h）')
+    plt.xlabel('小时')
+    plt.ylim(0)
+    plt.title(f'{route}公交车速分布')
+    plt.savefig(f"图片/{route}公交车速分布.svg", format="svg")
+    plt.close(fig4)
+
+print("所有图片已保存到'图片'文件夹中")
@@ -0,0 +1,36 @@
+import os
+import warnings
+warnings.filterwarnings("ignore")
+import pandas as pd
+
+from 运营指标 import compute_headways, headway_summary, route_regularity
+
+# 到站表由 3公交数据分析.py 生成
+ARRIVEINFO = r'data/arriveinfo.parquet'
+
+# 创建结果保存目录
+os.makedirs("结果", exist_ok=True)
+
+# 读取所有线路的到站信息
+arriveinfo = pd.read_parquet(ARRIVEINFO)
+print(f"读取到站记录 {len(arriveinfo)} 条，共 {arriveinfo['linename'].nunique()} 条线路")
+
+# 计算每次到站的车头时距，并标记串车、大间隔与服务中断
+headways = compute_headways(arriveinfo)
+print(f"车头时距 {len(headways)} 条，串车 {int(headways['bunching'].sum())} 次，大间隔 {int(headways['gap'].sum())} 次，"
+      f"其中服务中断 {int(headways['service_break'].sum())} 次")
+
+# 按线路、站点、小时汇总
+summary = headway_summary(headways)
+summary.to_csv(r'结果/车头时距统计.csv', index=False, encoding='utf-8-sig')
+
+# 串车与大间隔（含服务中断）事件明细
+events = headways[headways['bunching'] | headways['gap']]
+events.to_csv(r'结果/串车与大间隔事件.csv', index=False, encoding='utf-8-sig')
+
+# 各线路运行规律性
+regularity = route_regularity(headways)
+regularity.to_csv(r'结果/线路运行规律性.csv', index=False, encoding='utf-8-sig')
+print(regularity)
+
+print("车头时距分析结果已保存到'结果'文件夹中")
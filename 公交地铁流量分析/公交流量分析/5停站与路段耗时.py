@@ -0,0 +1,46 @@
+import os
+import warnings
+warnings.filterwarnings("ignore")
+import geopandas as gpd
+import pandas as pd
+
+from 地图匹配 import project_stops
+from 行程分析 import link_times, segment_trips, stop_visits
+
+# 匹配后的 GPS 数据由 并行预处理.py 生成（已剔除静止冗余记录，保留每次静止的首尾两条）
+BUSGPS_CLEAN = r'data/busgps_clean.parquet'
+# 静止位置与站点的最大距离（米），超过该距离的停车视为站外停车（如信号灯、拥堵）
+DWELL_DISTANCE = 100
+
+# 创建结果保存目录
+os.makedirs("结果", exist_ok=True)
+
+# 读取公交线路与站点数据并转换为投影坐标系
+line = gpd.GeoDataFrame.from_file(r'data/busline.json', encoding='utf-8')
+line.crs = {'init': 'epsg:4326'}
+line_2416 = line.to_crs(epsg=2416)
+stop = gpd.GeoDataFrame.from_file(r'data/busstop.json', encoding='utf-8')
+stop.crs = {'init': 'epsg:4326'}
+stop_project = project_stops(stop.to_crs(epsg=2416), line_2416)
+
+# 读取全部车辆的匹配结果并划分行程
+BUS_GPS = pd.read_parquet(BUSGPS_CLEAN, columns=['VehicleId', 'GPSDateTime', 'lon', 'lat', 'linename', 'project'])
+BUS_GPS = segment_trips(BUS_GPS, 'VehicleId', 'GPSDateTime', 'project', timegap=30*60, line_col='linename')
+
+# 每个行程在各站点的停站时长
+visits = stop_visits(BUS_GPS, stop_project, max_distance=DWELL_DISTANCE)
+visits.to_parquet(r'结果/停站记录.parquet', index=False)
+print(f"停站记录 {len(visits)} 条，其中停车 {int((visits['dwell'] > 0).sum())} 次")
+
+# 每个行程相邻站点之间的路段行程时间
+links = link_times(visits)
+links.to_parquet(r'结果/路段行程时间.parquet', index=False)
+print(f"路段行程时间 {len(links)} 条")
+
+# 各站点平均停站时长与各路段平均行程时间
+dwell_summary = visits.groupby(['linename', 'stopname'])['dwell'].agg(['count', 'mean', 'median']).reset_index()
+dwell_summary.to_csv(r'结果/站点停站时长统计.csv', index=False, encoding='utf-8-sig')
+link_summary = links.groupby(['linename', 'ostop', 'dstop'])['linktime'].agg(['count', 'mean', 'median']).reset_index()
+link_summary.to_csv(r'结果/路段行程时间统计.csv', index=False, encoding='utf-8-sig')
+
+print("停站与路段耗时结果已保存到'结果'文件夹中")
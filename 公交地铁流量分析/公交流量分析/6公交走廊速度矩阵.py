@@ -0,0 +1,51 @@
+import os
+import warnings
+warnings.filterwarnings("ignore")
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from 行程分析 import segment_trips, speed_matrix
+
+# 设置 Matplotlib 显示中文和负号
+plt.rcParams['font.sans-serif'] = ['SimHei']
+plt.rcParams['font.serif'] = ['SimHei']
+plt.rcParams['axes.unicode_minus'] = False
+
+# 匹配后的 GPS 数据由 并行预处理.py 生成
+BUSGPS_CLEAN = r'data/busgps_clean.parquet'
+# 速度矩阵的时间区间（秒）、距离区间（米）与重采样步长（秒）
+TIME_BIN = 300
+DISTANCE_BIN = 200
+SAMPLE_INTERVAL = 10
+
+os.makedirs("图片", exist_ok=True)
+os.makedirs("结果", exist_ok=True)
+
+# 读取全部车辆的匹配结果并划分行程
+BUS_GPS = pd.read_parquet(BUSGPS_CLEAN, columns=['VehicleId', 'GPSDateTime', 'linename', 'project'])
+BUS_GPS = segment_trips(BUS_GPS, 'VehicleId', 'GPSDateTime', 'project', timegap=30*60, line_col='linename')
+
+# 计算线路 × 距离区间 × 时间区间的速度矩阵并保存
+matrix = speed_matrix(BUS_GPS, time_bin=TIME_BIN, distance_bin=DISTANCE_BIN, sample_interval=SAMPLE_INTERVAL)
+np.savez_compressed(r'结果/速度矩阵.npz', **matrix)
+print(f"速度矩阵大小 {matrix['speed'].shape}，已保存到 '结果/速度矩阵.npz'")
+
+# 每条线路绘制一张时空速度热力图
+time_edges = mdates.date2num(matrix['time_edges'])
+for k, linename in enumerate(matrix['lines']):
+    fig = plt.figure(figsize=(10, 6), dpi=250)
+    ax = plt.subplot(111)
+    mesh = ax.pcolormesh(time_edges, matrix['distance_edges'], matrix['speed'][k],
+                         cmap='RdYlGn', vmin=0, vmax=40, shading='flat')
+    plt.colorbar(mesh, ax=ax, label='平均速度（km/h）')
+    ax.xaxis_date()
+    ax.xaxis.set_major_formatter(mdates.DateFormatter('%H:%M'))
+    plt.xlabel('时间')
+    plt.ylabel('距线路起点距离（米）')
+    plt.title(f'{linename} 时空速度图')
+    plt.savefig(f"图片/{linename}时空速度图.png", format="png", bbox_inches='tight')
+    plt.close(fig)
+
+print("时空速度图已保存到'图片'文件夹中")
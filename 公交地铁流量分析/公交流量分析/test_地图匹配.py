@@ -0,0 +1,75 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+from shapely.geometry import LineString, MultiLineString
+
+from 地图匹配 import LineMatcher, hmm_match, map_match_lines, project_stops
+
+
+def _line():
+    return gpd.GeoDataFrame({'name': ['测试线路']}, geometry=[LineString([(0, 0), (1000, 0)])], crs='EPSG:2416')
+
+
+def _gps(x, y):
+    return gpd.GeoDataFrame({
+        'VehicleId': ['1'] * len(x),
+        'GPSDateTime': pd.date_range('2024-01-01 08:00', periods=len(x), freq='30s'),
+    }, geometry=gpd.points_from_xy(x, y), crs='EPSG:2416')
+
+
+# 所有点都偏离线路时返回空的候选，而不是报错
+def test_candidates_all_off_route():
+    matcher = LineMatcher(_line())
+    pt, ln, project, dist, match_x, match_y = matcher.candidates([500.0, 600.0], [5000.0, 5000.0], radius=200)
+    assert len(pt) == len(ln) == len(project) == len(dist) == len(match_x) == len(match_y) == 0
+    pt, *_ = matcher.candidates([500.0], [5000.0], radius=200, leg_length=400)
+    assert len(pt) == 0
+
+
+def test_match_all_off_route():
+    matcher = LineMatcher(_line())
+    line_index, project, diff, match_x, match_y = matcher.match([500.0], [5000.0], radius=200)
+    assert line_index.tolist() == [-1]
+    assert np.isnan(project).all()
+
+    gps = _gps([500.0, 600.0], [5000.0, 5000.0])
+    assert len(map_match_lines(gps, matcher)) == 0
+    assert len(hmm_match(gps, matcher)) == 0
+
+
+def test_match_on_route():
+    matcher = LineMatcher(_line())
+    gps = _gps([100.0, 300.0, 500.0], [10.0, -20.0, 5000.0])
+    matched = hmm_match(gps, matcher)
+    assert len(matched) == 2
+    assert np.allclose(matched['project'], [100.0, 300.0])
+
+
+def test_project_stops():
+    stop = gpd.GeoDataFrame({'linename': ['测试线路', '测试线路', '其他线路'], 'stopname': ['甲', '乙', '丙']},
+                            geometry=gpd.points_from_xy([200.0, 700.0, 0.0], [10.0, -10.0, 0.0]), crs='EPSG:2416')
+    stop_project = project_stops(stop, _line())
+    assert stop_project['stopname'].tolist() == ['甲', '乙']
+    assert np.allclose(stop_project['project'], [200.0, 700.0])
+
+
+# 线路名称重复时报错，而不是按名称取到多条线路
+def test_project_stops_duplicated_line_name():
+    line = pd.concat([_line(), _line()], ignore_index=True)
+    stop = gpd.GeoDataFrame({'linename': ['测试线路'], 'stopname': ['甲']},
+                            geometry=gpd.points_from_xy([200.0], [10.0]), crs='EPSG:2416')
+    with pytest.raises(ValueError, match='测试线路'):
+        project_stops(stop, line)
+
+
+# MultiLineString 各部分之间没有线段，project 按各部分长度依次累计
+def test_multilinestring_parts():
+    geom = MultiLineString([[(0, 0), (1000, 0)], [(1000, 500), (2000, 500)]])
+    line = gpd.GeoDataFrame({'name': ['测试线路']}, geometry=[geom], crs='EPSG:2416')
+    matcher = LineMatcher(line)
+    line_index, project, diff, match_x, match_y = matcher.match([1000.0, 1500.0], [250.0, 510.0], radius=200)
+    assert line_index.tolist() == [-1, 0]
+    assert np.isclose(project[1], 1500.0)
+    assert np.isclose(project[1], shapely.line_locate_point(geom, shapely.points(1500.0, 510.0)))
@@ -0,0 +1,55 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString
+
+from 并行预处理 import BUFFER_DISTANCE, MATCH_DISTANCE, parallel_preprocess
+from 数据清洗 import clean_outofbuffer, clean_same
+from 地图匹配 import LineMatcher, map_match_lines
+
+
+def _lines():
+    line = gpd.GeoDataFrame({'name': ['1路', '2路'], 'LineId': ['1', '2'], 'ToDir': [0, 0]},
+                            geometry=[LineString([(121.40, 31.20), (121.42, 31.20)]),
+                                      LineString([(121.40, 31.21), (121.42, 31.21)])], crs='EPSG:4326')
+    return line.to_crs(epsg=2416)
+
+
+def _gps():
+    rng = np.random.default_rng(0)
+    rows = []
+    for v in range(6):
+        line_id = str(v % 2 + 1)
+        lat = 31.20 if line_id == '1' else 31.21
+        t = pd.Timestamp('2024-01-01 07:00')
+        for k in range(40):
+            lon = 121.40 + 0.0005 * k if k % 10 < 7 else 121.40 + 0.0005 * (k - k % 10 + 6)
+            # 偶尔偏离线路较远的点
+            dlat = 0.01 if k == 15 else rng.normal(0, 0.0002)
+            rows.append([f'V{v}', line_id, 0, t + pd.Timedelta(seconds=20 * k), lon, lat + dlat])
+        # 重复的记录
+        rows.append(rows[-1])
+    return pd.DataFrame(rows, columns=['VehicleId', 'LineId', 'ToDir', 'GPSDateTime', 'lon', 'lat'])
+
+
+# 与 1数据预处理.py 相同的串行步骤
+def _serial(gps, line_2416):
+    df = gps.drop_duplicates(subset=['VehicleId', 'GPSDateTime']).sort_values(by=['VehicleId', 'GPSDateTime'])
+    df = clean_same(df, col=['VehicleId', 'GPSDateTime', 'lon', 'lat'])
+    df, _ = clean_outofbuffer(df, line_2416, distance=BUFFER_DISTANCE, col=['lon', 'lat'])
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df['lon'], df['lat']), crs='EPSG:4326').to_crs(epsg=2416)
+    return map_match_lines(gdf, LineMatcher(line_2416), radius=MATCH_DISTANCE)
+
+
+# 串行与按车辆分片的并行预处理结果一致，与进程数、分片大小无关
+def test_parallel_matches_serial():
+    gps, line_2416 = _gps(), _lines()
+    serial = _serial(gps, line_2416)
+    cols = ['VehicleId', 'GPSDateTime', 'linename', 'project', 'diff']
+    for processes, shard_size in [(1, 50), (1, 10 ** 6), (2, 50)]:
+        parallel, duration, dropped = parallel_preprocess(gps, line_2416, processes=processes,
+                                                          shard_size=shard_size)
+        pd.testing.assert_frame_equal(parallel[cols].reset_index(drop=True), serial[cols].reset_index(drop=True),
+                                      check_exact=False)
+        assert len(duration) == 6 * 39
+        assert int(dropped.sum()) == 6
@@ -0,0 +1,21 @@
+import pandas as pd
+
+from 数据入库 import ingest_busgps, read_busgps
+
+
+# 日期 × 线路的分区数超过 pyarrow 默认的 1024 个时仍能完整入库
+def test_ingest_many_partitions(tmp_path):
+    nlines, ndays = 400, 3
+    rows = []
+    for day in range(ndays):
+        for line_id in range(nlines):
+            rows.append([f'2024-01-0{day + 1} 08:00:00', line_id, f'{line_id}路', 1, 0, '121.4,31.2', 0,
+                         f'V{line_id}', f'沪A{line_id}', 0])
+    csv_path = tmp_path / 'busgps.csv'
+    pd.DataFrame(rows).to_csv(csv_path, header=False, index=False)
+    out_path = tmp_path / 'busgps_parquet'
+    assert ingest_busgps(str(csv_path), str(out_path)) == nlines * ndays
+
+    BUS_GPS = read_busgps(str(out_path), columns=['GPSDateTime', 'LineId', 'VehicleId'])
+    assert len(BUS_GPS) == nlines * ndays
+    assert BUS_GPS['LineId'].nunique() == nlines
@@ -0,0 +1,27 @@
+import pandas as pd
+
+from 数据清洗 import clean_same
+
+
+# 位置相同的连续记录（游程）只保留首尾两条：长度 1、2 的游程全部保留，长度 3 及以上的去掉中间的记录；
+# 车辆切换处总是游程的边界
+def test_clean_same_runs():
+    lon = [0, 1, 1, 2, 2, 2, 3, 3, 3, 3, 4]
+    df = pd.DataFrame({
+        'VehicleId': ['A'] * 10 + ['B'],
+        'GPSDateTime': pd.date_range('2024-01-01 08:00', periods=11, freq='10s'),
+        'lon': lon,
+        'lat': 0.0,
+    })
+    # B 的位置与 A 的最后一条相同，但属于另一辆车
+    df.loc[10, 'lon'] = 3
+    # 打乱顺序，clean_same 先按车辆、时间排序
+    result = clean_same(df.sample(frac=1, random_state=0))
+    assert result.index.tolist() == [0, 1, 2, 3, 5, 6, 9, 10]
+    assert result['lon'].tolist() == [0, 1, 1, 2, 2, 3, 3, 3]
+    assert result['VehicleId'].tolist() == ['A'] * 7 + ['B']
+
+
+def test_clean_same_empty():
+    df = pd.DataFrame({'VehicleId': [], 'GPSDateTime': pd.to_datetime([]), 'lon': [], 'lat': []})
+    assert len(clean_same(df)) == 0
@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+
+from 行程分析 import stop_visits
+
+
+# 环线首末站同名：同一行程在首站、末站的两次停站分别识别，不合并为一次
+def test_stop_visits_loop_route():
+    stop = pd.DataFrame({'linename': ['环线'] * 3, 'stopname': ['甲', '乙', '甲'], 'project': [0.0, 500.0, 1000.0]})
+    project = np.array([0, 0, 0, 250, 500, 750, 1000, 1000, 1000], dtype=float)
+    gps = pd.DataFrame({
+        'VehicleId': '1',
+        'tripid': 1,
+        'linename': '环线',
+        'GPSDateTime': pd.Timestamp('2024-01-01 08:00') + pd.to_timedelta(
+            [0, 30, 60, 120, 180, 240, 300, 330, 390], unit='s'),
+        'project': project,
+        'lon': project,
+        'lat': 0.0,
+    })
+    visits = stop_visits(gps, stop)
+    assert visits['stopname'].tolist() == ['甲', '乙', '甲']
+    assert visits['dwell'].tolist() == [60.0, 0.0, 90.0]
+    assert visits['arrivetime'].tolist() == [pd.Timestamp('2024-01-01 08:00:00'), pd.Timestamp('2024-01-01 08:03:00'),
+                                             pd.Timestamp('2024-01-01 08:05:00')]
+    assert visits['leavetime'].iloc[2] == pd.Timestamp('2024-01-01 08:06:30')
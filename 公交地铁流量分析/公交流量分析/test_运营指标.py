@@ -0,0 +1,61 @@
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.geometry import LineString
+
+from 运营指标 import boxplot_stats, compute_headways, headway_median, onewaytime_batch, route_regularity, route_terminals
+
+
+def _arrivals(stop_index, stopname, times):
+    return pd.DataFrame({'linename': '环线', 'stop_index': stop_index, 'stopname': stopname,
+                         'arrivetime': pd.to_datetime(times)})
+
+
+# 环线首末站同名：两端的到站分别计算车头时距，不会相互穿插产生过短的车头时距
+def test_headways_loop_route():
+    arriveinfo = _arrivals(
+        [0, 2, 0, 2, 0, 2], ['甲'] * 6,
+        ['2024-01-01 07:00', '2024-01-01 07:02', '2024-01-01 07:10', '2024-01-01 07:12',
+         '2024-01-01 07:20', '2024-01-01 07:22'])
+    headways = compute_headways(arriveinfo)
+    assert headways['headway'].tolist() == [600.0] * 4
+    assert not headways['bunching'].any()
+
+
+# 服务中断保留在结果中，规律性的基准中位数与 compute_headways 一致，不含服务中断
+def test_service_break_median():
+    arriveinfo = _arrivals(
+        [0] * 5, ['甲'] * 5,
+        ['2024-01-01 09:00', '2024-01-01 09:10', '2024-01-01 09:20', '2024-01-01 11:30', '2024-01-01 11:40'])
+    headways = compute_headways(arriveinfo)
+    assert headways['service_break'].tolist() == [False, False, True, False]
+    assert headways['gap'].tolist() == [False, False, True, False]
+    median = headway_median(headways)
+    assert np.allclose(median, [600.0] * 4)
+    regularity = route_regularity(headways)
+    assert regularity['service_break'].tolist() == [1]
+
+
+# 环线起终点站同名时，按站点编号区分起点、终点，得到完整的单程耗时
+def test_onewaytime_loop_route():
+    stop = pd.DataFrame({'linename': '环线', 'stopname': ['甲', '乙', '甲'], 'project': [0.0, 3000.0, 6000.0],
+                         'stop_index': [0, 1, 2]})
+    line = gpd.GeoDataFrame({'name': ['环线']}, geometry=[LineString([(0, 0), (3000, 0), (3000, 3000)])])
+    terminals = route_terminals(stop, line)
+    assert terminals[['startstop', 'endstop', 'start_index', 'end_index']].values.tolist() == [['甲', '甲', 0, 2]]
+
+    t = pd.Timestamp('2024-01-01 08:00')
+    arriveinfo = pd.DataFrame({
+        'VehicleId': '1', 'tripid': 1, 'linename': '环线', 'stopname': ['甲', '乙', '甲'], 'stop_index': [0, 1, 2],
+        'arrivetime': [t, t + pd.Timedelta(minutes=10), t + pd.Timedelta(minutes=20)],
+        'leavetime': [t + pd.Timedelta(minutes=1), t + pd.Timedelta(minutes=11), t + pd.Timedelta(minutes=21)],
+    })
+    onewaytime = onewaytime_batch(arriveinfo, terminals)
+    assert onewaytime['duration'].tolist() == [19 * 60.0]
+    assert np.allclose(onewaytime['speed'], 6000 / (19 * 60) * 3.6)
+
+
+def test_boxplot_stats_whiskers():
+    df = pd.DataFrame({'linename': 'L', 'shour': 8, 'v': [1.0, 2.0, 3.0, 4.0, 100.0]})
+    stats = boxplot_stats(df, 'v')
+    assert stats[['whislo', 'whishi']].values.tolist() == [[1.0, 4.0]]
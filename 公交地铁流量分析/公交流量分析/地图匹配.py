@@ -0,0 +1,271 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import shapely
+
+
+# 将坐标点投影至线路上，返回每个点在线路上的位置（距线路起点的距离）
+# 使用 shapely 2 的数组运算一次处理整批点，分块计算以控制内存
+def project_points(lineshp, x, y, chunksize=1000000):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    project = np.empty(len(x))
+    for i in range(0, len(x), chunksize):
+        points = shapely.points(x[i:i + chunksize], y[i:i + chunksize])
+        project[i:i + chunksize] = shapely.line_locate_point(lineshp, points)
+    return project
+
+
+# 地图匹配：返回线路上的位置 project、匹配点坐标 (match_x, match_y) 以及原始点与匹配点的距离 diff
+def match_points(lineshp, x, y, chunksize=1000000):
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    project = project_points(lineshp, x, y, chunksize)
+    match_x = np.empty(len(x))
+    match_y = np.empty(len(x))
+    for i in range(0, len(x), chunksize):
+        matched = shapely.line_interpolate_point(lineshp, project[i:i + chunksize])
+        match_x[i:i + chunksize], match_y[i:i + chunksize] = shapely.get_x(matched), shapely.get_y(matched)
+    diff = np.hypot(x - match_x, y - match_y)
+    return project, match_x, match_y, diff
+
+
+# 对投影坐标系下的 GPS 点做地图匹配
+# 生成 project、diff 列，原始点存入 geometry_orgin 列，geometry 替换为匹配点
+# max_distance 不为空时，只保留距离线路 max_distance 米内的点
+def map_match(gdf, lineshp, max_distance=None, chunksize=1000000):
+    gdf = gdf.copy()
+    project, match_x, match_y, diff = match_points(
+        lineshp, gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy(), chunksize)
+    gdf['project'] = project
+    gdf['geometry_orgin'] = gdf['geometry']
+    gdf['geometry'] = gpd.points_from_xy(match_x, match_y, crs=gdf.crs)
+    gdf['diff'] = diff
+    if max_distance is not None:
+        gdf = gdf[gdf['diff'] < max_distance]
+    return gdf
+
+
+# 多线路地图匹配：将所有线路（含上下行）拆分为线段并建立 STRtree 空间索引，
+# 每个点只与半径 radius 内的候选线段计算距离，取距离最近的线路作为匹配结果
+class LineMatcher:
+    def __init__(self, lines, key_cols=['LineId', 'ToDir']):
+        # lines 为投影坐标系下的线路 GeoDataFrame，key_cols 中线路表里存在的列用于约束候选线路
+        self.lines = lines.reset_index(drop=True)
+        self.geoms = np.asarray(self.lines.geometry.array)
+        self.key_cols = [c for c in key_cols if c in self.lines.columns]
+
+        # 拆分线段：seg_line 为线段所属线路，seg_offset 为线段起点距线路起点的距离
+        # MultiLineString 按组成部分分别拆分，不把上一部分的终点与下一部分的起点连成线段，
+        # 各部分的长度依次累计（与 shapely.line_locate_point 的 project 一致）
+        parts, part_line = shapely.get_parts(self.geoms, return_index=True)
+        coords, index = shapely.get_coordinates(parts, return_index=True)
+        valid = index[:-1] == index[1:]
+        self.seg_start = coords[:-1][valid]
+        self.seg_end = coords[1:][valid]
+        self.seg_line = part_line[index[:-1][valid]]
+        self.seg_length = np.hypot(*(self.seg_end - self.seg_start).T)
+        cumlength = np.cumsum(self.seg_length) - self.seg_length
+        first = np.r_[True, self.seg_line[1:] != self.seg_line[:-1]]
+        self.seg_offset = cumlength - cumlength[first][np.cumsum(first) - 1]
+        self.tree = shapely.STRtree(shapely.linestrings(np.stack([self.seg_start, self.seg_end], axis=1)))
+
+    # 生成候选匹配：返回 (点序号, 线路序号, project, 距离, 匹配点 x, 匹配点 y)，
+    # 同一点在同一线路上只保留最近的一个候选；给定 leg_length 时，同一线路上 project 相差较远的
+    # 不同路段（如线路折返经过同一道路）各保留一个候选
+    # keys 为与点一一对应的 DataFrame（如 GPS 数据的 LineId、ToDir 列），仅保留键值一致的候选线路
+    def candidates(self, x, y, radius=200, keys=None, leg_length=None):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        # 先用以点为中心、边长 2*radius 的方框查询空间索引，再按精确距离筛选
+        pt_idx, seg_idx = self.tree.query(shapely.box(x - radius, y - radius, x + radius, y + radius))
+        ln_idx = self.seg_line[seg_idx]
+        if keys is not None:
+            for c in self.key_cols:
+                if c in keys.columns:
+                    same = keys[c].to_numpy()[pt_idx] == self.lines[c].to_numpy()[ln_idx]
+                    pt_idx, seg_idx, ln_idx = pt_idx[same], seg_idx[same], ln_idx[same]
+
+        # 点到线段的投影，t 为投影点在线段上的比例
+        start = self.seg_start[seg_idx]
+        vector = self.seg_end[seg_idx] - start
+        length = self.seg_length[seg_idx]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            t = ((x[pt_idx] - start[:, 0]) * vector[:, 0] + (y[pt_idx] - start[:, 1]) * vector[:, 1]) / length ** 2
+        t = np.clip(np.nan_to_num(t), 0, 1)
+        match_x = start[:, 0] + t * vector[:, 0]
+        match_y = start[:, 1] + t * vector[:, 1]
+        dist = np.hypot(x[pt_idx] - match_x, y[pt_idx] - match_y)
+        project = self.seg_offset[seg_idx] + t * length
+        within = dist <= radius
+        pt_idx, ln_idx, project, dist = pt_idx[within], ln_idx[within], project[within], dist[within]
+        match_x, match_y = match_x[within], match_y[within]
+        # 半径内没有任何候选时返回空数组
+        if len(pt_idx) == 0:
+            return pt_idx, ln_idx, project, dist, match_x, match_y
+
+        # 同一点同一线路（同一路段）内按距离排序，取最近的线段
+        leg = np.zeros(len(project), dtype=int) if leg_length is None else (project // leg_length).astype(int)
+        order = np.lexsort((dist, leg, ln_idx, pt_idx))
+        pt_idx, ln_idx, leg = pt_idx[order], ln_idx[order], leg[order]
+        first = np.r_[True, (pt_idx[1:] != pt_idx[:-1]) | (ln_idx[1:] != ln_idx[:-1]) | (leg[1:] != leg[:-1])]
+        order = order[first]
+        return pt_idx[first], ln_idx[first], project[order], dist[order], match_x[order], match_y[order]
+
+    # 返回每个点匹配到的线路序号 line_index（无候选时为 -1）、线路上的位置 project、距离 diff 与匹配点坐标
+    def match(self, x, y, radius=200, keys=None, chunksize=1000000):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        line_index = np.full(len(x), -1)
+        project, diff, match_x, match_y = (np.full(len(x), np.nan) for _ in range(4))
+        for i in range(0, len(x), chunksize):
+            chunk_keys = None if keys is None else keys.iloc[i:i + chunksize]
+            pt_idx, ln_idx, pr, dist, mx, my = self.candidates(
+                x[i:i + chunksize], y[i:i + chunksize], radius, chunk_keys)
+            # 每个点取距离最近的候选线路
+            order = np.lexsort((dist, pt_idx))
+            first = order[np.r_[True, pt_idx[order][1:] != pt_idx[order][:-1]]] if len(order) else order
+            rows = i + pt_idx[first]
+            line_index[rows] = ln_idx[first]
+            project[rows], diff[rows] = pr[first], dist[first]
+            match_x[rows], match_y[rows] = mx[first], my[first]
+        return line_index, project, diff, match_x, match_y
+
+
+# 多线路地图匹配，生成 line_index、linename、project、diff 列，
+# 原始点存入 geometry_orgin 列，geometry 替换为匹配点；半径内没有候选线路的点被剔除
+def map_match_lines(gdf, matcher, radius=200, name_col='name', chunksize=1000000):
+    keys = gdf[[c for c in matcher.key_cols if c in gdf.columns]]
+    line_index, project, diff, match_x, match_y = matcher.match(
+        gdf.geometry.x.to_numpy(), gdf.geometry.y.to_numpy(), radius, keys, chunksize)
+    matched = line_index >= 0
+    gdf = gdf[matched].copy()
+    gdf['line_index'] = line_index[matched]
+    gdf['linename'] = matcher.lines[name_col].to_numpy()[line_index[matched]]
+    gdf['project'] = project[matched]
+    gdf['diff'] = diff[matched]
+    gdf['geometry_orgin'] = gdf['geometry']
+    gdf['geometry'] = gpd.points_from_xy(match_x[matched], match_y[matched], crs=gdf.crs)
+    return gdf
+
+
+# 对一段连续的轨迹点做 Viterbi 解码，返回每个有候选的点选中的候选序号
+# pt、ln、project、dist 为按点排序的候选，x、y、brk 为按点的坐标与轨迹中断标记
+# 发射概率：匹配距离服从方差为 sigma 的正态分布
+# 转移概率：同一线路上沿线距离与两点直线距离之差服从尺度为 beta 的指数分布，
+# 沿线倒退超过 backward 米视为不可行；切换线路（如到达终点后掉头）固定扣 switch_cost
+def viterbi(pt, ln, project, dist, x, y, brk, sigma=30, beta=100, switch_cost=10, backward=50):
+    emission = -0.5 * (dist / sigma) ** 2
+    score = np.full(len(pt), -np.inf)
+    back = np.full(len(pt), -1)
+    starts = np.flatnonzero(np.r_[True, pt[1:] != pt[:-1]]) if len(pt) else np.array([], dtype=int)
+    ends = np.r_[starts[1:], len(pt)]
+    step_pt = pt[starts]
+    # 两个相邻的有候选的点之间出现换车或长时间间隔，则轨迹中断，重新开始解码
+    segment = np.cumsum(brk)[step_pt]
+    for k in range(len(starts)):
+        s, e = starts[k], ends[k]
+        if k == 0 or segment[k] != segment[k - 1]:
+            score[s:e] = emission[s:e]
+            continue
+        ps, pe = starts[k - 1], ends[k - 1]
+        gc = np.hypot(x[step_pt[k]] - x[step_pt[k - 1]], y[step_pt[k]] - y[step_pt[k - 1]])
+        route = project[s:e][None, :] - project[ps:pe][:, None]
+        same = ln[ps:pe][:, None] == ln[s:e][None, :]
+        trans = np.where(same, -np.abs(route - gc) / beta, -switch_cost)
+        trans[same & (route < -backward)] = -np.inf
+        total = score[ps:pe][:, None] + trans
+        best = total.argmax(axis=0)
+        best_score = total[best, np.arange(e - s)]
+        if np.isneginf(best_score).all():
+            # 没有可行的转移，视为轨迹中断
+            score[s:e] = emission[s:e]
+        else:
+            score[s:e] = best_score + emission[s:e]
+            back[s:e] = ps + best
+    # 回溯最优路径
+    chosen = np.full(len(starts), -1)
+    cur = -1
+    for k in range(len(starts) - 1, -1, -1):
+        if cur < 0:
+            cur = starts[k] + score[starts[k]:ends[k]].argmax()
+        chosen[k] = cur
+        cur = back[cur]
+    return chosen
+
+
+def _viterbi_batch(args):
+    offset, pt, ln, project, dist, x, y, brk, params = args
+    return offset + viterbi(pt, ln, project, dist, x, y, brk, **params)
+
+
+# 基于隐马尔可夫模型的轨迹地图匹配：对每辆车的轨迹用 Viterbi 算法选出连贯的匹配位置，
+# 避免线路共线或折返时就近投影匹配到错误的路段
+# 候选点一次性批量生成，各车辆的解码按 batch_points 个点一组分配到 processes 个进程并行计算
+# 生成 line_index、linename、project、diff 列，原始点存入 geometry_orgin 列，geometry 替换为匹配点
+def hmm_match(gdf, matcher, radius=200, sigma=30, beta=100, switch_cost=10, backward=50, max_gap=1800,
+              vehicle_col='VehicleId', time_col='GPSDateTime', name_col='name',
+              processes=1, batch_points=200000, chunksize=1000000):
+    gdf = gdf.sort_values(by=[vehicle_col, time_col])
+    x = gdf.geometry.x.to_numpy()
+    y = gdf.geometry.y.to_numpy()
+    keys = gdf[[c for c in matcher.key_cols if c in gdf.columns]]
+
+    # 批量生成候选点
+    cands = []
+    for i in range(0, len(gdf), chunksize):
+        chunk_keys = None if keys.shape[1] == 0 else keys.iloc[i:i + chunksize]
+        c = matcher.candidates(x[i:i + chunksize], y[i:i + chunksize], radius, chunk_keys, leg_length=2 * radius)
+        cands.append((c[0] + i,) + c[1:])
+    pt, ln, project, dist, match_x, match_y = (np.concatenate(a) for a in zip(*cands))
+
+    # 换车或时间间隔超过 max_gap 秒处轨迹中断
+    vehicle = gdf[vehicle_col].to_numpy()
+    seconds = (gdf[time_col] - gdf[time_col].min()).dt.total_seconds().to_numpy()
+    new_vehicle = np.r_[True, vehicle[1:] != vehicle[:-1]]
+    brk = new_vehicle | np.r_[True, np.diff(seconds) > max_gap]
+
+    # 按车辆边界划分计算批次
+    vehicle_starts = np.flatnonzero(new_vehicle)
+    targets = np.searchsorted(vehicle_starts, np.arange(0, len(gdf), batch_points))
+    cuts = np.unique(np.r_[vehicle_starts[targets[targets < len(vehicle_starts)]], len(gdf)])
+    params = dict(sigma=sigma, beta=beta, switch_cost=switch_cost, backward=backward)
+    tasks = []
+    for a, b in zip(cuts[:-1], cuts[1:]):
+        ca, cb = np.searchsorted(pt, [a, b])
+        tasks.append((ca, pt[ca:cb] - a, ln[ca:cb], project[ca:cb], dist[ca:cb],
+                      x[a:b], y[a:b], brk[a:b], params))
+    if processes == 1:
+        chosen = [_viterbi_batch(t) for t in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            chosen = list(executor.map(_viterbi_batch, tasks))
+    chosen = np.concatenate(chosen) if chosen else np.array([], dtype=int)
+
+    rows = pt[chosen]
+    gdf = gdf.iloc[rows].copy()
+    gdf['line_index'] = ln[chosen]
+    gdf['linename'] = matcher.lines[name_col].to_numpy()[ln[chosen]]
+    gdf['project'] = project[chosen]
+    gdf['diff'] = dist[chosen]
+    gdf['geometry_orgin'] = gdf['geometry']
+    gdf['geometry'] = gpd.points_from_xy(match_x[chosen], match_y[chosen], crs=gdf.crs)
+    return gdf
+
+
+# 将站点投影至各自所属的线路上，生成 project 列
+# stop_line_col 为站点表中线路名称的列，line_name_col 为线路表中对应的列
+# 站点只能按线路名称对应到线路，线路名称重复时无法确定所属线路，直接报错
+# 输出按线路、project 排序，并生成站点编号 stop_index，用于区分同一线路上的同名站点（如环线的首末站）
+def project_stops(stop, line_proj, stop_line_col='linename', line_name_col='name'):
+    duplicated = line_proj[line_name_col][line_proj[line_name_col].duplicated()].unique()
+    if len(duplicated):
+        raise ValueError(f"线路表中 {line_name_col} 列存在重复的线路名称，无法确定站点所属线路：{list(duplicated)}")
+    stop = stop[stop[stop_line_col].isin(line_proj[line_name_col])].copy()
+    geoms = line_proj.set_index(line_name_col).geometry
+    stop['project'] = shapely.line_locate_point(
+        np.asarray(geoms.loc[stop[stop_line_col]].array), np.asarray(stop.geometry.array))
+    stop = stop.sort_values(by=[stop_line_col, 'project'], kind='stable').reset_index(drop=True)
+    stop['stop_index'] = np.arange(len(stop))
+    return stop
@@ -0,0 +1,114 @@
+import os
+import warnings
+warnings.filterwarnings("ignore")
+from concurrent.futures import ProcessPoolExecutor
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from pyproj import Transformer
+
+from 数据入库 import BUSGPS_PARQUET, ingest_busgps, read_busgps
+from 数据清洗 import clean_outofbuffer, clean_same
+from 地图匹配 import LineMatcher
+
+# 并行参数：进程数与每个分片的记录数
+PROCESSES = os.cpu_count()
+SHARD_SIZE = 500000
+# 地图匹配的距离阈值（米），超过该距离的坐标点视为偏离线路
+MATCH_DISTANCE = 200
+# 线路缓冲区半径（米），与 1数据预处理.py 的缓冲区清洗一致
+BUFFER_DISTANCE = 200
+
+# 每个进程初始化时建立一次线路索引，之后处理各分片时复用
+_line = None
+_matcher = None
+_transformer = None
+
+
+def _init_worker(line_2416):
+    global _line, _matcher, _transformer
+    _line = line_2416
+    _matcher = LineMatcher(line_2416)
+    _transformer = Transformer.from_crs('EPSG:4326', 'EPSG:2416', always_xy=True)
+
+
+# 处理一个分片：与 1数据预处理.py 相同的去重、采样间隔统计、剔除静止冗余记录、剔除线路缓冲区外的记录，
+# 再做地图匹配并剔除偏离线路的点；分片内包含若干车辆的全部记录，各分片之间互不依赖
+# 返回处理后的记录、采样间隔与各线路剔除的缓冲区外记录数
+def preprocess_shard(shard, match_distance=MATCH_DISTANCE, buffer_distance=BUFFER_DISTANCE):
+    # 一辆车在一个时刻只保留一条记录
+    shard = shard.drop_duplicates(subset=['VehicleId', 'GPSDateTime'])
+    shard = shard.sort_values(by=['VehicleId', 'GPSDateTime'])
+
+    # 采样间隔：仅统计同一辆车相邻两条记录的时间差
+    same_vehicle = (shard['VehicleId'] == shard['VehicleId'].shift(-1)).to_numpy()
+    duration = (shard['GPSDateTime'].shift(-1) - shard['GPSDateTime']).dt.total_seconds().to_numpy()
+    duration = duration[same_vehicle]
+
+    # 剔除车辆静止时的冗余记录
+    shard = clean_same(shard, col=['VehicleId', 'GPSDateTime', 'lon', 'lat'])
+    # 剔除线路缓冲区范围外的记录
+    shard, dropped = clean_outofbuffer(shard, _line, distance=buffer_distance, col=['lon', 'lat'])
+
+    # 转换为投影坐标后做多线路地图匹配
+    x, y = _transformer.transform(shard['lon'].to_numpy(), shard['lat'].to_numpy())
+    keys = shard[[c for c in _matcher.key_cols if c in shard.columns]]
+    line_index, project, diff, match_x, match_y = _matcher.match(x, y, radius=match_distance, keys=keys)
+    shard = shard.assign(x=x, y=y, line_index=line_index, project=project, diff=diff,
+                         match_x=match_x, match_y=match_y)
+    shard = shard[shard['line_index'] >= 0].copy()
+    shard['linename'] = _matcher.lines['name'].to_numpy()[shard['line_index'].to_numpy()]
+    return shard, duration, dropped
+
+
+# 按车辆将数据切分为约 shard_size 条记录的分片，同一车辆的记录只会落在一个分片内
+# 去重、剔除静止冗余记录与采样间隔都按车辆的完整轨迹计算，因此只能按车辆分片（不能按线路，一辆车可能跑多条线路）
+def make_shards(df, vehicle_col='VehicleId', shard_size=SHARD_SIZE):
+    counts = df.groupby(vehicle_col, sort=True).size()
+    shard_of_key = (counts.cumsum() - counts) // shard_size
+    shard_id = df[vehicle_col].map(shard_of_key).to_numpy()
+    return [shard for _, shard in df.groupby(shard_id, sort=True)]
+
+
+# 并行预处理：按车辆分片交给进程池处理，结果按分片顺序合并，输出与进程数、分片大小无关
+# 返回匹配后的 GPS 数据、所有车辆的采样间隔与各线路剔除的缓冲区外记录数
+def parallel_preprocess(BUS_GPS, line_2416, processes=PROCESSES, shard_size=SHARD_SIZE,
+                        match_distance=MATCH_DISTANCE, buffer_distance=BUFFER_DISTANCE):
+    shards = make_shards(BUS_GPS, shard_size=shard_size)
+    if processes == 1:
+        _init_worker(line_2416)
+        results = [preprocess_shard(shard, match_distance, buffer_distance) for shard in shards]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(line_2416,)) as executor:
+            results = list(executor.map(preprocess_shard, shards, [match_distance] * len(shards),
+                                        [buffer_distance] * len(shards)))
+    if not results:
+        return BUS_GPS.iloc[:0], np.array([]), pd.Series(dtype=int)
+    BUS_GPS_clean = pd.concat([r[0] for r in results], ignore_index=True)
+    sample_duration = np.concatenate([r[1] for r in results])
+    dropped = pd.concat([r[2] for r in results]).groupby(level=0, sort=False).sum()
+    return BUS_GPS_clean, sample_duration, dropped
+
+
+if __name__ == '__main__':
+    # 读取 GPS 数据（首次运行时先将 CSV 分块解析入库）
+    if not os.path.exists(BUSGPS_PARQUET):
+        ingest_busgps(r'data/busgps.csv', BUSGPS_PARQUET)
+    BUS_GPS = read_busgps(BUSGPS_PARQUET, columns=['GPSDateTime', 'LineId', 'LineName', 'NextLevel', 'PrevLevel',
+                                                   'ToDir', 'VehicleId', 'VehicleNo', 'lon', 'lat'])
+
+    # 读取公交线数据并转换为投影坐标系
+    line = gpd.GeoDataFrame.from_file(r'data/busline.json', encoding='utf-8')
+    line.crs = {'init': 'epsg:4326'}
+    line_2416 = line.to_crs(epsg=2416)
+
+    BUS_GPS_clean, sample_duration, dropped = parallel_preprocess(BUS_GPS, line_2416)
+    print(f"并行预处理完成：{len(BUS_GPS)} 条记录，保留 {len(BUS_GPS_clean)} 条")
+    print("各线路剔除的缓冲区外记录数：")
+    print(dropped)
+    print(f"采样间隔中位数：{np.median(sample_duration) if len(sample_duration) else float('nan')} 秒")
+
+    BUS_GPS_clean.to_parquet(r'data/busgps_clean.parquet', index=False)
+    print("预处理结果已保存到 'data/busgps_clean.parquet'")
@@ -0,0 +1,82 @@
+import os
+import shutil
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import transbigdata as tbd
+
+# 原始 GPS 数据的列名与类型
+BUSGPS_COLUMNS = ['GPSDateTime', 'LineId', 'LineName', 'NextLevel', 'PrevLevel',
+                  'Strlatlon', 'ToDir', 'VehicleId', 'VehicleNo', 'unknow']
+BUSGPS_DTYPES = {
+    'GPSDateTime': str,
+    'LineId': 'int32',
+    'LineName': str,
+    'NextLevel': 'Int16',
+    'PrevLevel': 'Int16',
+    'Strlatlon': str,
+    'ToDir': 'Int8',
+    'VehicleId': str,
+    'VehicleNo': str,
+    'unknow': 'Int16',
+}
+
+# 入库后的数据按日期和线路分区存储
+BUSGPS_PARQUET = 'data/busgps_parquet'
+BUSGPS_PARTITIONING = ds.partitioning(
+    pa.schema([('date', pa.string()), ('LineId', pa.int32())]), flavor='hive')
+# 写入时同时打开的文件数上限，超过时关闭最久未写入的文件（该分区之后写入新文件）
+BUSGPS_MAX_OPEN_FILES = 1024
+
+
+# 对一个数据块做解析：时间转换、切分经纬度字符串、坐标系转换
+def parse_busgps_chunk(chunk):
+    chunk['GPSDateTime'] = pd.to_datetime(chunk['GPSDateTime'])
+    # 用向量化的字符串方法切分经纬度，不再逐行调用 lambda
+    lonlat = chunk['Strlatlon'].str.split(',', n=1, expand=True)
+    chunk['lon'], chunk['lat'] = tbd.gcj02towgs84(lonlat[0].astype(float), lonlat[1].astype(float))
+    chunk['date'] = chunk['GPSDateTime'].dt.strftime('%Y-%m-%d')
+    return chunk.drop(columns=['Strlatlon'])
+
+
+# 分块读取 busgps.csv，转换为 WGS84 后写入按日期、线路分区的 Parquet 数据集
+# 内存峰值只取决于 chunksize，与文件大小无关
+def ingest_busgps(csv_path='data/busgps.csv', out_path=BUSGPS_PARQUET, chunksize=1000000):
+    # 重新入库时先清空旧的数据集，避免重复写入
+    if os.path.exists(out_path):
+        shutil.rmtree(out_path)
+    reader = pd.read_csv(csv_path, header=None, names=BUSGPS_COLUMNS,
+                         dtype=BUSGPS_DTYPES, chunksize=chunksize)
+    nrows = 0
+    for i, chunk in enumerate(reader):
+        chunk = parse_busgps_chunk(chunk)
+        table = pa.Table.from_pandas(chunk, preserve_index=False)
+        # 分区数为数据块中 日期 × 线路 的组合数，几百条线路、多天的数据会超过 pyarrow 默认的 1024 个分区上限
+        npartitions = max(len(chunk[['date', 'LineId']].drop_duplicates()), 1)
+        ds.write_dataset(table, out_path, format='parquet',
+                         partitioning=BUSGPS_PARTITIONING,
+                         basename_template=f'chunk{i}-{{i}}.parquet',
+                         existing_data_behavior='overwrite_or_ignore',
+                         max_partitions=npartitions,
+                         max_open_files=min(npartitions, BUSGPS_MAX_OPEN_FILES))
+        nrows += len(chunk)
+    return nrows
+
+
+# 读取入库后的 GPS 数据，columns 指定读取的列，dates、line_ids 指定读取的分区
+def read_busgps(path=BUSGPS_PARQUET, columns=None, dates=None, line_ids=None):
+    dataset = ds.dataset(path, format='parquet', partitioning=BUSGPS_PARTITIONING)
+    condition = None
+    if dates is not None:
+        condition = ds.field('date').isin([str(d) for d in dates])
+    if line_ids is not None:
+        line_condition = ds.field('LineId').isin([int(i) for i in line_ids])
+        condition = line_condition if condition is None else condition & line_condition
+    table = dataset.to_table(columns=columns, filter=condition)
+    return table.to_pandas()
+
+
+if __name__ == '__main__':
+    nrows = ingest_busgps()
+    print(f"GPS 数据入库完成，共 {nrows} 条记录，保存在 '{BUSGPS_PARQUET}'")
@@ -0,0 +1,62 @@
+import numpy as np
+import pandas as pd
+import shapely
+from pyproj import Transformer
+
+
+# 剔除车辆静止时的冗余记录：对于连续位置相同的一段记录（一个“游程”），只保留首尾两条
+# 整张排好序的表一次性用数组运算标记游程的起点和终点，耗时与行数成线性关系
+def clean_same(df, col=('VehicleId', 'GPSDateTime', 'lon', 'lat')):
+    # col 的前两列为车辆 ID 与时间，其余列为判断位置是否相同的字段
+    [vehicle_col, time_col] = col[:2]
+    check_cols = [vehicle_col] + [c for c in col[2:] if c != time_col]
+
+    df = df.sort_values(by=[vehicle_col, time_col]).reset_index(drop=True)
+    if len(df) == 0:
+        return df
+
+    # 车辆 ID 也参与比较，因此车辆切换处必然是游程的边界
+    values = df[check_cols]
+    # 与上一条记录不同，即为游程的起点
+    is_start = values.ne(values.shift()).any(axis=1).to_numpy()
+    # 与下一条记录不同，即为游程的终点
+    is_end = values.ne(values.shift(-1)).any(axis=1).to_numpy()
+
+    return df[np.logical_or(is_start, is_end)]
+
+
+# 剔除公交线路缓冲区范围外的数据：在投影坐标系下对每条线路做 distance 米缓冲区，
+# 预处理（prepare）缓冲区多边形后用向量化的点在多边形内判断，结果精确，不依赖栅格近似
+# GPS 数据与线路数据都有 route_col 列时，每个点只判断是否落在自身线路的缓冲区内；
+# 否则判断是否落在任意一条线路的缓冲区内
+# 返回清理后的数据与各线路被剔除的记录数
+def clean_outofbuffer(df, line_proj, distance=200, col=['lon', 'lat'], route_col='LineId'):
+    transformer = Transformer.from_crs('EPSG:4326', line_proj.crs, always_xy=True)
+    x, y = transformer.transform(df[col[0]].to_numpy(), df[col[1]].to_numpy())
+    buffers = shapely.buffer(np.asarray(line_proj.geometry.array), distance)
+
+    inside = np.zeros(len(df), dtype=bool)
+    if route_col in df.columns and route_col in line_proj.columns:
+        # 按线路分组，每组点只与该线路（含上下行）的缓冲区做一次批量判断
+        codes, routes = pd.factorize(df[route_col])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(routes) + 1))
+        line_routes = line_proj[route_col].to_numpy()
+        for k, route in enumerate(routes):
+            route_buffers = buffers[line_routes == route]
+            if len(route_buffers) == 0:
+                continue
+            polygon = shapely.union_all(route_buffers)
+            shapely.prepare(polygon)
+            idx = order[bounds[k]:bounds[k + 1]]
+            inside[idx] = shapely.intersects_xy(polygon, x[idx], y[idx])
+    else:
+        polygon = shapely.union_all(buffers)
+        shapely.prepare(polygon)
+        inside = shapely.intersects_xy(polygon, x, y)
+
+    if route_col in df.columns:
+        dropped = df.loc[~inside, route_col].value_counts().reindex(df[route_col].unique(), fill_value=0)
+    else:
+        dropped = pd.Series({'全部线路': int((~inside).sum())})
+    return df[inside], dropped
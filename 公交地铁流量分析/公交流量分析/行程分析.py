@@ -0,0 +1,261 @@
+import numpy as np
+import pandas as pd
+
+
+# 行程划分：按车辆、时间排序后，在时间间隔超过 timegap 秒处以及车辆沿线路行驶方向反转（终点掉头）处切分行程
+# 一次向量化计算给每条记录分配行程编号 trip_col 与行驶方向 direction_col
+# （1 为 project 增大方向，-1 为 project 减小方向，0 为整段静止无法判断）
+# 单步位移小于 min_move 米视为定位抖动，同一方向累计位移不足 reverse_distance 米的反向移动不视为掉头
+# 给定 line_col 时（多线路匹配结果中的所属线路），匹配线路变化处也切分行程
+def segment_trips(df, vehicle_col='VehicleId', time_col='GPSDateTime', project_col='project',
+                  timegap=1800, min_move=10, reverse_distance=300,
+                  trip_col='tripid', direction_col='direction', line_col=None):
+    df = df.sort_values(by=[vehicle_col, time_col], kind='stable').copy()
+    if len(df) == 0:
+        df[trip_col] = pd.Series(dtype=int)
+        df[direction_col] = pd.Series(dtype=int)
+        return df
+    vehicle = df[vehicle_col].to_numpy()
+    seconds = (df[time_col] - df[time_col].min()).dt.total_seconds().to_numpy()
+    project = df[project_col].to_numpy(dtype=float)
+
+    # 换车、换线路或时间间隔过长处为新的轨迹段
+    seg_start = np.r_[True, (vehicle[1:] != vehicle[:-1]) | (np.diff(seconds) > timegap)]
+    if line_col is not None:
+        line = df[line_col].to_numpy()
+        seg_start[1:] |= line[1:] != line[:-1]
+    seg = np.cumsum(seg_start)
+
+    # 每一步的位移与方向，抖动的步继承前一步的方向
+    dp = np.r_[0, np.diff(project)]
+    dp[seg_start | np.isnan(dp)] = 0
+    step = np.where(np.abs(dp) >= min_move, np.sign(dp), np.nan)
+    step = pd.Series(step).groupby(seg).ffill().to_numpy()
+
+    # 同一方向连续的步组成一个“游程”，计算每个游程的累计位移
+    changed = (step[1:] != step[:-1]) & ~(np.isnan(step[1:]) & np.isnan(step[:-1]))
+    run_start = seg_start | np.r_[True, changed]
+    run_id = np.cumsum(run_start) - 1
+    displacement = np.add.reduceat(dp, np.flatnonzero(run_start))
+    run_sign = step[run_start]
+    # 累计位移不足的游程视为噪声，方向取同一轨迹段内前一个（或后一个）有效游程的方向
+    run_sign[np.abs(displacement) < reverse_distance] = np.nan
+    run_seg = seg[run_start]
+    run_sign = pd.Series(run_sign).groupby(run_seg).ffill()
+    run_sign = run_sign.groupby(run_seg).bfill().fillna(0).to_numpy().astype(int)
+    direction = run_sign[run_id]
+
+    # 轨迹段起点或方向变化处为新的行程
+    trip_start = seg_start | np.r_[True, direction[1:] != direction[:-1]]
+    df[trip_col] = np.cumsum(trip_start)
+    df[direction_col] = direction
+    return df
+
+
+# 到站识别：根据每个行程在线路上的位置序列 project 与站点的 project，
+# 计算车辆驶入、驶出站点前后 stopbuffer 米范围的时刻，作为到站时间 arrivetime 与离站时间 leavetime
+# 每个行程内按行驶方向对 project 取累计最大值使其单调，所有行程拼成一个全局有序的数组，
+# 全部 (行程, 站点) 组合一次 searchsorted 查找并线性插值，不逐车、逐站循环
+# line_col 为 GPS 数据中匹配线路的列，stop_line_col 为站点表中对应线路的列；
+# 输出的 VehicleId、stopname、arrivetime、leavetime 列与 tbd.busgps_onewaytime 兼容；
+# 给定 stop_id_col 时站点表中的该列一并输出，用于区分同名站点（如环线的首末站）
+def arrive_info(df, stop, trip_col='tripid', vehicle_col='VehicleId', time_col='GPSDateTime',
+                project_col='project', line_col='linename', stop_line_col='linename',
+                stopname_col='stopname', stopbuffer=200, stop_id_col=None):
+    df = df.sort_values(by=[trip_col, time_col], kind='stable')
+    trip = df[trip_col].to_numpy()
+    line = df[line_col].to_numpy()
+    starttime = df[time_col].min()
+    seconds = (df[time_col] - starttime).dt.total_seconds().to_numpy()
+    project = df[project_col].to_numpy(dtype=float)
+
+    # 同一行程、同一线路的连续记录为一组，行驶方向取组内首尾位移的符号
+    group_start = np.flatnonzero(np.r_[True, (trip[1:] != trip[:-1]) | (line[1:] != line[:-1])])
+    group_end = np.r_[group_start[1:], len(df)]
+    group_id = np.repeat(np.arange(len(group_start)), group_end - group_start)
+    direction = np.sign(project[group_end - 1] - project[group_start])
+    direction[direction == 0] = 1
+
+    # 组内按方向取累计最大值后，加上组序号乘以足够大的间隔，得到全局单调的位置键
+    gap = 4 * (np.nanmax(np.abs(project)) + stopbuffer + 1) if len(df) else 1
+    key = np.maximum.accumulate(group_id * gap + direction[group_id] * np.nan_to_num(project))
+
+    # 每组与其线路上的所有站点组合
+    groups = pd.DataFrame({'group': np.arange(len(group_start)), stop_line_col: line[group_start]})
+    stop_cols = [stop_line_col, stopname_col, 'project'] + ([stop_id_col] if stop_id_col is not None else [])
+    pairs = pd.merge(groups, stop[stop_cols], on=stop_line_col)
+    g = pairs['group'].to_numpy()
+    position = pairs['project'].to_numpy()
+    lo, hi = group_start[g], group_end[g] - 1
+    key_arrive = g * gap + direction[g] * position - stopbuffer
+    key_leave = g * gap + direction[g] * position + stopbuffer
+
+    # 在全局有序的位置键上查找穿越时刻并线性插值
+    def crossing_time(target):
+        i = np.clip(np.searchsorted(key, target, side='left'), lo + 1, np.maximum(hi, lo + 1))
+        i = np.minimum(i, len(key) - 1)
+        k0, k1 = key[i - 1], key[i]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            ratio = np.clip(np.where(k1 > k0, (target - k0) / (k1 - k0), 0), 0, 1)
+        return seconds[i - 1] + ratio * (seconds[i] - seconds[i - 1])
+
+    arrive = crossing_time(key_arrive)
+    leave = crossing_time(key_leave)
+    # 行程起点已在站点范围内（如始发站），到站时间取行程开始时刻；
+    # 行程终点仍在站点范围内（如终点站），离站时间取行程结束时刻
+    first_key, last_key = key[lo], key[hi]
+    arrive = np.where(key_arrive <= first_key, seconds[lo], arrive)
+    leave = np.where(key_leave > last_key, seconds[hi], leave)
+    # 行程未经过站点范围的组合剔除
+    visited = (first_key <= key_leave) & (last_key >= key_arrive) & (hi > lo)
+
+    vehicle = df[vehicle_col].to_numpy()
+    result = pd.DataFrame({
+        vehicle_col: vehicle[lo],
+        trip_col: trip[lo],
+        line_col: pairs[stop_line_col].to_numpy(),
+        stopname_col: pairs[stopname_col].to_numpy(),
+        'arrivetime': starttime + pd.to_timedelta(arrive, unit='s'),
+        'leavetime': starttime + pd.to_timedelta(leave, unit='s'),
+    })
+    if stop_id_col is not None:
+        result[stop_id_col] = pairs[stop_id_col].to_numpy()
+    result = result[visited]
+    return result.sort_values(by=[vehicle_col, 'arrivetime']).reset_index(drop=True)
+
+
+# 停站识别：clean_same 保留的同一位置首尾两条记录即为一次静止（停车）的开始与结束，
+# 静止位置按所在线路与站点 project 对齐到最近的站点（不超过 max_distance 米），
+# 同一行程在同一站点的多次静止合并为一次停站，停站时长为各次静止时长之和；
+# 站点以线路上的站序区分，环线首末站等同名站点的停站不会合并
+# 未停车通过的站点由 arrive_info 求出驶过站点位置的时刻，停站时长记为 0
+# 返回每个行程经过每个站点的到站时间、离站时间与停站时长 dwell（秒）
+def stop_visits(df, stop, trip_col='tripid', vehicle_col='VehicleId', time_col='GPSDateTime',
+                project_col='project', line_col='linename', stop_line_col='linename',
+                stopname_col='stopname', col=['lon', 'lat'], max_distance=100):
+    df = df.sort_values(by=[trip_col, time_col], kind='stable')
+    trip = df[trip_col].to_numpy()
+    position = df[col].to_numpy()
+    seconds = (df[time_col] - df[time_col].min()).dt.total_seconds().to_numpy()
+
+    # 同一行程内相邻两条记录位置相同即为一次静止
+    still = np.flatnonzero((trip[1:] == trip[:-1]) & (position[1:] == position[:-1]).all(axis=1)
+                           & (np.diff(seconds) > 0))
+    runs = pd.DataFrame({
+        trip_col: trip[still],
+        line_col: df[line_col].to_numpy()[still],
+        'project': df[project_col].to_numpy(dtype=float)[still],
+        'start': df[time_col].to_numpy()[still],
+        'end': df[time_col].to_numpy()[still + 1],
+    })
+
+    # 站点按线路、project 排序，线路编号乘以足够大的间隔后拼成一个有序数组，一次查找最近站点
+    # 排序后的行号 stop_index 作为站点的唯一编号
+    stop = stop.sort_values(by=[stop_line_col, 'project']).reset_index(drop=True)
+    stop['stop_index'] = np.arange(len(stop))
+    lines = pd.Index(stop[stop_line_col].unique())
+    gap = 4 * (max(stop['project'].max(), runs['project'].max() if len(runs) else 0) + max_distance + 1)
+    stop_key = lines.get_indexer(stop[stop_line_col]) * gap + stop['project'].to_numpy()
+    run_line = lines.get_indexer(runs[line_col])
+    runs = runs[run_line >= 0]
+    run_key = run_line[run_line >= 0] * gap + runs['project'].to_numpy()
+    right = np.minimum(np.searchsorted(stop_key, run_key), len(stop_key) - 1)
+    left = np.maximum(right - 1, 0)
+    nearest = np.where(np.abs(stop_key[left] - run_key) <= np.abs(stop_key[right] - run_key), left, right)
+    runs = runs.assign(stop_index=nearest)
+    runs = runs[np.abs(stop_key[nearest] - run_key) <= max_distance]
+
+    dwell = runs.groupby([trip_col, line_col, 'stop_index']).agg(
+        dwell_start=('start', 'min'), dwell_end=('end', 'max'))
+    dwell['dwell'] = runs.assign(duration=(runs['end'] - runs['start']).dt.total_seconds()).groupby(
+        [trip_col, line_col, 'stop_index'])['duration'].sum()
+
+    # 所有经过的站点（包括不停车通过的）及驶过站点位置的时刻
+    passing = arrive_info(df, stop, trip_col=trip_col, vehicle_col=vehicle_col, time_col=time_col,
+                          project_col=project_col, line_col=line_col, stop_line_col=stop_line_col,
+                          stopname_col=stopname_col, stopbuffer=0, stop_id_col='stop_index')
+    visits = passing.merge(dwell.reset_index(), on=[trip_col, line_col, 'stop_index'], how='left')
+    stopped = visits['dwell'].notnull()
+    visits.loc[stopped, 'arrivetime'] = visits.loc[stopped, 'dwell_start']
+    visits.loc[stopped, 'leavetime'] = visits.loc[stopped, 'dwell_end']
+    visits['dwell'] = visits['dwell'].fillna(0)
+    visits = visits.drop(columns=['stop_index', 'dwell_start', 'dwell_end'])
+    return visits.sort_values(by=[trip_col, 'arrivetime']).reset_index(drop=True)
+
+
+# 路段行程时间：同一行程相邻两个站点，从上一站离站到下一站到站的时间（秒）
+def link_times(visits, trip_col='tripid', vehicle_col='VehicleId', line_col='linename', stopname_col='stopname'):
+    visits = visits.sort_values(by=[trip_col, 'arrivetime'], kind='stable')
+    nxt = visits.shift(-1)
+    same_trip = (visits[trip_col] == nxt[trip_col]).to_numpy()
+    links = pd.DataFrame({
+        trip_col: visits[trip_col],
+        vehicle_col: visits[vehicle_col],
+        line_col: visits[line_col],
+        'ostop': visits[stopname_col],
+        'dstop': nxt[stopname_col],
+        'leavetime': visits['leavetime'],
+        'arrivetime': nxt['arrivetime'],
+    })[same_trip]
+    links['linktime'] = (links['arrivetime'] - links['leavetime']).dt.total_seconds()
+    return links.reset_index(drop=True)
+
+
+# 时空速度矩阵：每个行程的 (时间, project) 序列以 sample_interval 秒为步长重采样，
+# 所有行程的时间加上行程序号乘以足够大的间隔后拼成一个单调数组，一次 np.interp 完成全部行程的插值
+# 相邻采样点的位移除以步长即为速度，按线路 × 距离区间 × 时间区间用 np.bincount 累加后求平均
+# 返回字典：speed（km/h，无数据为 nan）、count（采样数）、lines、distance_edges（米）、time_edges
+def speed_matrix(df, trip_col='tripid', time_col='GPSDateTime', project_col='project', line_col='linename',
+                 start_time=None, end_time=None, time_bin=300, distance_bin=200, sample_interval=10):
+    df = df.sort_values(by=[trip_col, time_col], kind='stable')
+    start_time = pd.Timestamp(start_time if start_time is not None else df[time_col].min()).floor(f'{time_bin}s')
+    end_time = pd.Timestamp(end_time if end_time is not None else df[time_col].max())
+    seconds = (df[time_col] - start_time).dt.total_seconds().to_numpy()
+    project = df[project_col].to_numpy(dtype=float)
+    trip = df[trip_col].to_numpy()
+    lines, line_code = np.unique(df[line_col].to_numpy(), return_inverse=True)
+
+    # 每个行程在采样网格上的起止格点
+    trip_start = np.flatnonzero(np.r_[True, trip[1:] != trip[:-1]])
+    trip_end = np.r_[trip_start[1:], len(df)] - 1
+    first = np.ceil(seconds[trip_start] / sample_interval).astype(np.int64)
+    last = np.floor(seconds[trip_end] / sample_interval).astype(np.int64)
+    n = np.maximum(last - first + 1, 0)
+
+    # 所有行程的采样格点一次生成
+    trip_index = np.repeat(np.arange(len(trip_start)), n)
+    step = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+    grid = (first[trip_index] + step) * sample_interval
+
+    # 拼接成全局单调的时间键后一次插值
+    gap = 2 * (seconds.max() - seconds.min() + sample_interval) if len(df) else 1
+    trip_id = np.repeat(np.arange(len(trip_start)), trip_end - trip_start + 1)
+    sampled = np.interp(trip_index * gap + grid, trip_id * gap + seconds, project)
+
+    # 同一行程相邻采样点之间为一个速度样本，位置与时间取两点中点
+    pair = np.flatnonzero(trip_index[1:] == trip_index[:-1])
+    speed = np.abs(sampled[pair + 1] - sampled[pair]) / sample_interval * 3.6
+    position = (sampled[pair + 1] + sampled[pair]) / 2
+    midtime = grid[pair] + sample_interval / 2
+    line = line_code[trip_start[trip_index[pair]]]
+
+    # 按线路 × 距离区间 × 时间区间累加
+    n_time = int(np.ceil((end_time - start_time).total_seconds() / time_bin))
+    n_distance = int(np.ceil(np.nanmax(project) / distance_bin)) + 1 if len(df) else 1
+    tbin = np.floor(midtime / time_bin).astype(np.int64)
+    dbin = np.floor(position / distance_bin).astype(np.int64)
+    valid = (tbin >= 0) & (tbin < n_time) & (dbin >= 0) & (dbin < n_distance)
+    flat = (line[valid] * n_distance + dbin[valid]) * n_time + tbin[valid]
+    size = len(lines) * n_distance * n_time
+    count = np.bincount(flat, minlength=size).reshape(len(lines), n_distance, n_time)
+    total = np.bincount(flat, weights=speed[valid], minlength=size).reshape(len(lines), n_distance, n_time)
+    with np.errstate(invalid='ignore'):
+        mean_speed = total / count
+
+    return {
+        'speed': mean_speed.astype(np.float32),
+        'count': count.astype(np.int32),
+        'lines': lines.astype(str),
+        'distance_edges': np.arange(n_distance + 1) * float(distance_bin),
+        'time_edges': np.datetime64(start_time, 's') + np.arange(n_time + 1) * np.timedelta64(time_bin, 's'),
+    }
@@ -0,0 +1,49 @@
+import numpy as np
+
+
+# 按车辆（或行程）连续存储的轨迹数据
+# 数据按 key_col、time_col 排序后，时间与各数值列存为连续的 numpy 数组，
+# offsets[i]:offsets[i+1] 为第 i 辆车的记录范围，取单车数据为零拷贝的数组切片，
+# 时间窗查询在单车范围内二分查找
+class TrajectoryStore:
+    def __init__(self, df, key_col='VehicleId', time_col='GPSDateTime', value_cols=['project']):
+        df = df.sort_values(by=[key_col, time_col], kind='stable')
+        key = df[key_col].to_numpy()
+        starts = np.flatnonzero(np.r_[True, key[1:] != key[:-1]]) if len(key) else np.array([], dtype=int)
+        self.key_col = key_col
+        self.keys = key[starts]
+        self.offsets = np.r_[starts, len(key)]
+        self.time = np.ascontiguousarray(df[time_col].to_numpy())
+        self.columns = {c: np.ascontiguousarray(df[c].to_numpy()) for c in value_cols}
+        self._position = {k: i for i, k in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, key):
+        return key in self._position
+
+    # 某辆车在数组中的记录范围 [start, end)
+    def bounds(self, key):
+        i = self._position[key]
+        return self.offsets[i], self.offsets[i + 1]
+
+    # 某辆车在 [start_time, end_time] 时间窗内的记录范围 [start, end)
+    def window(self, key, start_time, end_time):
+        start, end = self.bounds(key)
+        times = self.time[start:end]
+        lo = np.searchsorted(times, np.datetime64(start_time, 'ns'), side='left')
+        hi = np.searchsorted(times, np.datetime64(end_time, 'ns'), side='right')
+        return start + lo, start + hi
+
+    # 取某辆车的时间与指定列，可限定时间窗，返回数组切片（不复制数据）
+    def get(self, key, col, start_time=None, end_time=None):
+        if start_time is None:
+            start, end = self.bounds(key)
+        else:
+            start, end = self.window(key, start_time, end_time)
+        return self.time[start:end], self.columns[col][start:end]
+
+    # 每辆车的记录数
+    def counts(self):
+        return np.diff(self.offsets)
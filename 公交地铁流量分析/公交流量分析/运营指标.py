@@ -0,0 +1,139 @@
+import numpy as np
+import pandas as pd
+
+# 串车、大间隔的判定阈值：车头时距小于所在站点、小时中位数的 BUNCH_RATIO 倍视为串车，
+# 大于 GAP_RATIO 倍视为大间隔
+BUNCH_RATIO = 0.25
+GAP_RATIO = 2.0
+# 同一运营日内超过该时长（秒）的车头时距标记为服务中断（如午间停运、车辆故障），保留在结果中
+SERVICE_BREAK_HEADWAY = 3600
+
+
+# 车头时距：到站表按线路（上下行分别为一条线路）、站点、到站时间整体排序一次，
+# 同一站点相邻两次到站的时间差即为后一辆车的车头时距，并标记串车、大间隔与服务中断
+# 站点按 stop_col（project_stops 生成的站点编号）区分，环线首末站等同名站点的到站不会混在一起
+# 每个运营日各站点的首次到站没有前车，不计算车头时距；日内的长间隔不剔除，标记为服务中断
+def compute_headways(arriveinfo, line_col='linename', stop_col='stop_index', time_col='arrivetime',
+                     bunch_ratio=BUNCH_RATIO, gap_ratio=GAP_RATIO, service_break=SERVICE_BREAK_HEADWAY):
+    df = arriveinfo.sort_values(by=[line_col, stop_col, time_col], kind='stable').reset_index(drop=True)
+    line = df[line_col].to_numpy()
+    stop = df[stop_col].to_numpy()
+    seconds = (df[time_col] - df[time_col].min()).dt.total_seconds().to_numpy()
+    date = df[time_col].dt.normalize().to_numpy()
+
+    # 同一线路、同一站点、同一运营日的相邻到站才计算时间差
+    same_stop = np.r_[False, (line[1:] == line[:-1]) & (stop[1:] == stop[:-1]) & (date[1:] == date[:-1])]
+    headway = np.r_[np.nan, np.diff(seconds)]
+    headway[~same_stop] = np.nan
+    df['headway'] = headway
+    df['hour'] = df[time_col].dt.hour
+
+    # 以同一线路、站点、小时的车头时距中位数（不含服务中断）为基准判断串车与大间隔
+    df['service_break'] = headway > service_break
+    median = headway_median(df, line_col, stop_col).to_numpy()
+    df['bunching'] = headway < bunch_ratio * median
+    df['gap'] = (headway > gap_ratio * median) | df['service_break'].to_numpy()
+    return df[df['headway'].notnull()].reset_index(drop=True)
+
+
+# 同一线路、站点、小时的车头时距中位数，服务中断的长间隔不计入
+def headway_median(headways, line_col='linename', stop_col='stop_index'):
+    return headways['headway'].where(~headways['service_break']).groupby(
+        [headways[line_col], headways[stop_col], headways['hour']]).transform('median')
+
+
+# 按线路、站点、小时汇总车头时距：均值、中位数、标准差、变异系数、串车、大间隔与服务中断次数，
+# 以及乘客随机到站时的平均候车时间 E[h²]/(2E[h])
+def headway_summary(headways, line_col='linename', stop_col='stop_index', stopname_col='stopname'):
+    df = headways.assign(headway2=headways['headway'] ** 2)
+    summary = df.groupby([line_col, stop_col, stopname_col, 'hour']).agg(
+        count=('headway', 'size'),
+        mean=('headway', 'mean'),
+        median=('headway', 'median'),
+        std=('headway', 'std'),
+        headway2=('headway2', 'mean'),
+        bunching=('bunching', 'sum'),
+        gap=('gap', 'sum'),
+        service_break=('service_break', 'sum'),
+    ).reset_index()
+    summary['cv'] = summary['std'] / summary['mean']
+    summary['wait'] = summary['headway2'] / (2 * summary['mean'])
+    return summary.drop(columns='headway2')
+
+
+# 线路运行规律性：车头时距除以所在站点、小时的中位数（与 compute_headways 相同，不含服务中断）后求变异系数，
+# 同时给出串车率、大间隔率、服务中断次数与平均候车时间
+def route_regularity(headways, line_col='linename', stop_col='stop_index'):
+    median = headway_median(headways, line_col, stop_col)
+    df = headways.assign(ratio=headways['headway'] / median, headway2=headways['headway'] ** 2)
+    regularity = df.groupby(line_col).agg(
+        count=('headway', 'size'),
+        mean=('headway', 'mean'),
+        headway2=('headway2', 'mean'),
+        ratio_mean=('ratio', 'mean'),
+        ratio_std=('ratio', 'std'),
+        bunching_rate=('bunching', 'mean'),
+        gap_rate=('gap', 'mean'),
+        service_break=('service_break', 'sum'),
+    ).reset_index()
+    regularity['cv'] = regularity['ratio_std'] / regularity['ratio_mean']
+    regularity['wait'] = regularity['headway2'] / (2 * regularity['mean'])
+    return regularity.drop(columns=['headway2', 'ratio_mean', 'ratio_std'])
+
+
+# 各线路（上下行分别为一条线路）的起终点站与线路长度：起点站、终点站取线路上 project 最小、最大的站点
+# stop_project 为 project_stops 的输出，line_proj 为投影坐标系下的线路数据；
+# 起终点同时给出站点编号 start_index、end_index，环线首末站同名时也能区分
+def route_terminals(stop_project, line_proj, stop_line_col='linename', line_name_col='name'):
+    stop = stop_project.sort_values(by=[stop_line_col, 'project'])
+    terminals = stop.groupby(stop_line_col).agg(
+        startstop=('stopname', 'first'), endstop=('stopname', 'last'),
+        start_index=('stop_index', 'first'), end_index=('stop_index', 'last')).reset_index()
+    length = pd.Series(line_proj.geometry.length.to_numpy(), index=line_proj[line_name_col].to_numpy())
+    terminals['length'] = terminals[stop_line_col].map(length)
+    return terminals
+
+
+# 批量计算所有线路的单程耗时与运营速度：同一行程从起点站离站到终点站到站为一次单程
+# 起点、终点的到站记录按站点编号 stop_index 各自筛选后按行程连接，一次完成，不逐线路调用 tbd.busgps_onewaytime
+# 输出列与 tbd.busgps_onewaytime 一致（time 为起点离站时间，time1 为终点到站时间），另加 speed（km/h）；
+# 不按车速筛选，车速过快的异常单程由调用方在统计车速时剔除
+def onewaytime_batch(arriveinfo, terminals, trip_col='tripid', vehicle_col='VehicleId', line_col='linename'):
+    start = arriveinfo.merge(terminals, left_on=[line_col, 'stop_index'], right_on=[line_col, 'start_index'])
+    end = arriveinfo.merge(terminals[[line_col, 'endstop', 'end_index']], left_on=[line_col, 'stop_index'],
+                           right_on=[line_col, 'end_index'])
+    start = start.drop_duplicates(subset=[trip_col, line_col], keep='last')
+    end = end.drop_duplicates(subset=[trip_col, line_col], keep='first')
+    onewaytime = start[[vehicle_col, trip_col, line_col, 'startstop', 'endstop', 'length', 'leavetime']].merge(
+        end[[trip_col, line_col, 'arrivetime']], on=[trip_col, line_col])
+    onewaytime = onewaytime.rename(columns={'leavetime': 'time', 'arrivetime': 'time1'})
+    onewaytime['duration'] = (onewaytime['time1'] - onewaytime['time']).dt.total_seconds()
+    onewaytime = onewaytime[onewaytime['duration'] > 0]
+    onewaytime['shour'] = onewaytime['time'].dt.hour
+    onewaytime['direction'] = onewaytime['startstop'] + '-' + onewaytime['endstop']
+    # 车速单位转换为 km/h
+    onewaytime['speed'] = onewaytime['length'] / onewaytime['duration'] * 3.6
+    return onewaytime.reset_index(drop=True)
+
+
+# 按线路、小时分组一次计算箱型图所需的分位数，绘图只用汇总结果，不再传入每一条原始记录
+# 须线与 matplotlib 一致：延伸到 [q1 - 1.5·IQR, q3 + 1.5·IQR] 范围内最远的观测值
+def boxplot_stats(df, value_col, by=('linename', 'shour')):
+    by = list(by)
+    grouped = df.groupby(by)[value_col]
+    stats = grouped.quantile([0, 0.25, 0.5, 0.75, 1]).unstack()
+    stats.columns = ['min', 'q1', 'med', 'q3', 'max']
+    stats['mean'] = grouped.mean()
+    stats['count'] = grouped.size()
+    iqr = stats['q3'] - stats['q1']
+
+    # 每条记录对应分组的须线界限，界限内的记录再按组取最小、最大值
+    fence = df[by].merge(pd.DataFrame({'lo': stats['q1'] - 1.5 * iqr, 'hi': stats['q3'] + 1.5 * iqr}).reset_index(),
+                         on=by, how='left')
+    value = df[value_col].to_numpy()
+    inside = df[by].assign(value=np.where((value >= fence['lo'].to_numpy()) & (value <= fence['hi'].to_numpy()),
+                                          value, np.nan))
+    whisker = inside.groupby(by)['value'].agg(['min', 'max'])
+    stats['whislo'] = whisker['min']
+    stats['whishi'] = whisker['max']
+    return stats.reset_index()
@@ -0,0 +1,65 @@
+import matplotlib.dates as mdates
+import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.collections import LineCollection
+
+
+# 取 TrajectoryStore 中 [start_time, end_time] 时间窗内的所有相邻点对（同一车辆或行程内），
+# 返回线段起点、终点的时间（距 start_time 的秒数）、位置，以及线段所属车辆（行程）在 store 中的序号
+def _segments(store, col, start_time, end_time):
+    start_time, end_time = np.datetime64(start_time, 'ns'), np.datetime64(end_time, 'ns')
+    seconds = (store.time - start_time) / np.timedelta64(1, 's')
+    value = store.columns[col].astype(float)
+    inside = (store.time >= start_time) & (store.time <= end_time) & ~np.isnan(value)
+    # 车辆（行程）边界处断开
+    boundary = np.zeros(len(store.time), dtype=bool)
+    boundary[store.offsets[1:-1]] = True
+    pair = np.flatnonzero(inside[:-1] & inside[1:] & ~boundary[1:])
+    key_index = np.searchsorted(store.offsets, pair, side='right') - 1
+    return seconds[pair], value[pair], seconds[pair + 1], value[pair + 1], key_index
+
+
+# 运行图密度栅格：所有轨迹线段按像素步长采样后用 np.bincount 累加到 时间 × 距离 的栅格上
+# 返回 (栅格, 距离范围)，栅格行为距离、列为时间
+def trajectory_raster(store, col, start_time, end_time, n_time=2000, n_distance=1000, distance_range=None):
+    t0, p0, t1, p1, _ = _segments(store, col, start_time, end_time)
+    if distance_range is None:
+        distance_range = (np.nanmin(store.columns[col]), np.nanmax(store.columns[col]))
+    duration = (np.datetime64(end_time, 'ns') - np.datetime64(start_time, 'ns')) / np.timedelta64(1, 's')
+    # 换算为像素坐标
+    x0, x1 = t0 / duration * n_time, t1 / duration * n_time
+    scale = n_distance / max(distance_range[1] - distance_range[0], 1e-9)
+    y0, y1 = (p0 - distance_range[0]) * scale, (p1 - distance_range[0]) * scale
+
+    # 每条线段按不超过一个像素的步长采样，全部线段的采样点一次生成
+    n = np.ceil(np.maximum(np.abs(x1 - x0), np.abs(y1 - y0))).astype(np.int64) + 1
+    seg = np.repeat(np.arange(len(n)), n)
+    frac = (np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)) / np.maximum(n[seg] - 1, 1)
+    x = np.floor(x0[seg] + (x1[seg] - x0[seg]) * frac).astype(np.int64)
+    y = np.floor(y0[seg] + (y1[seg] - y0[seg]) * frac).astype(np.int64)
+    valid = (x >= 0) & (x < n_time) & (y >= 0) & (y < n_distance)
+    raster = np.bincount(y[valid] * n_time + x[valid], minlength=n_distance * n_time)
+    return raster.reshape(n_distance, n_time), distance_range
+
+
+# 在坐标轴上绘制运行图密度栅格
+def draw_raster(ax, raster, start_time, end_time, distance_range, cmap='viridis'):
+    extent = [mdates.date2num(start_time), mdates.date2num(end_time), distance_range[0], distance_range[1]]
+    image = ax.imshow(np.log1p(raster), extent=extent, origin='lower', aspect='auto', cmap=cmap,
+                      interpolation='nearest')
+    ax.xaxis_date()
+    return image
+
+
+# 所有轨迹作为一个 LineCollection 绘制，只创建一个图形对象，各车辆（行程）循环使用默认颜色序列
+def draw_lines(ax, store, col, start_time, end_time, linewidth=1, alpha=0.7):
+    t0, p0, t1, p1, key_index = _segments(store, col, start_time, end_time)
+    base = mdates.date2num(start_time)
+    segments = np.stack([np.c_[base + t0 / 86400, p0], np.c_[base + t1 / 86400, p1]], axis=1)
+    colors = plt.rcParams['axes.prop_cycle'].by_key()['color']
+    collection = LineCollection(segments, colors=np.array(colors)[key_index % len(colors)],
+                                linewidths=linewidth, alpha=alpha)
+    ax.add_collection(collection)
+    ax.xaxis_date()
+    ax.autoscale_view()
+    return collection
@@ -2,149 +2,76 @@
 import os
 
 import matplotlib.pyplot as plt
-import networkx as nx
 import numpy as np
 import pandas as pd
 
+from 客流分配 import (FLOW_CUBE_PATH, LOAD_PROFILE_PATH, flow_cube, flow_slice, load_flow_cube, load_profile,
+                  logit_incidence, save_flow_cube, time_to_seconds)
+from 刷卡数据 import METROOD_PARQUET, StationDictionary, chain_metro_trips, unmatched_report
+from 耗时标定 import CALIBRATED_EDGE_PATH
+from 轨道网络 import (k_shortest_paths, line_of, load_metro_graph, od_shortest_paths, path_edges, path_incidence,
+                  save_od_paths, script_processes)
+
+# 最短路计算的进程数：本脚本没有 if __name__ == '__main__' 保护，只在以 fork 方式创建子进程时使用进程池
+PROCESSES = script_processes()
+
+# 断面客流时间片长度（分钟）与绘图选取的时刻
+BIN_MINUTES = 60
+PLOT_TIME = '08:00'
+# 客流分配方式：'logit' 为多路径 Logit 分配（每个 OD 至多 K_PATHS 条考虑换乘费用的路径），'shortest' 为单一最短路分配
+ASSIGNMENT = 'logit'
+
 # 设置 Matplotlib 显示中文和负号
 plt.rcParams['font.sans-serif'] = ['SimHei']
 plt.rcParams['font.serif'] = ['SimHei']
 plt.rcParams['axes.unicode_minus'] = False
 
-# --- 读取轨道站点数据 ---
+# --- 读取轨道网络 ---
+# 轨道边与换乘边由 data/stop.csv 构建，编译结果缓存在 data/cache 中，站点数据不变时直接读取
+# 已运行 6轨道耗时标定.py 时使用标定后的边表
 try:
-    stop = pd.read_csv(r'data/stop.csv')
-    print("成功读取 'data/stop.csv'")
+    graph = load_metro_graph(r'data/stop.csv',
+                             edge_path=CALIBRATED_EDGE_PATH if os.path.exists(CALIBRATED_EDGE_PATH) else None)
+    print("成功读取轨道网络")
 except FileNotFoundError:
     print("错误：找不到文件 'data/stop.csv'。请确保文件存在于 'data' 子目录中，且脚本从正确的父目录运行。")
     exit()  # 如果文件找不到，则退出脚本
-
-# --- 第一部分：构建轨道边 (同一线路相邻站) ---
-print("第一部分：构建轨道边...")
-# 提取相邻站点信息用于构建边
-stop['linename1'] = stop['linename'].shift(-1)
-stop['stationnames1'] = stop['stationnames'].shift(-1)
-# 保留同一线路的相邻站点对
-stop = stop[stop['linename'] == stop['linename1']].copy() # 使用 .copy() 避免 SettingWithCopyWarning
-
-# 提取线路名 (去除括号和"地铁"前缀)
-stop['line'] = stop['linename'].apply(lambda r: r.split('(')[0].lstrip('地铁'))
-# 特殊处理五号线支线，统一线路名为"5号线"
-stop.loc[stop['line'] == '5号线支线', 'line'] = '5号线'
-
-# 重命名列名以区分起点和终点
-stop = stop.rename(columns={'stationnames': 'ostop', 'stationnames1': 'dstop'})
-
-# 构建唯一的站点名称 (线路名+站点名)，以区分不同线路的同名站
-stop['ostation'] = stop['line'] + stop['ostop']
-stop['dstation'] = stop['line'] + stop['dstop']
-
-# 构建网络边的第一部分：轨道边
-edge1 = stop[['ostation', 'dstation']].copy() # 使用 .copy() 避免 SettingWithCopyWarning
-# 给轨道边添加权重，假定搭乘一个站点耗时3分钟
-edge1['duration'] = 3
-print(f"轨道边构建完成，共 {len(edge1)} 条。")
-
-# --- 第二部分：构建换乘边 (不同线路同名站) ---
-print("第二部分：构建换乘边...")
-# (重新)计算唯一的站点名称 (基于 ostop)
-# 注意：确保 stop DataFrame 包含 'line' 和 'ostop' 列
-stop['station'] = stop['line'] + stop['ostop'] # 使用 ostop
-
-# 计算每个原始站点名 (ostop) 出现的次数，以识别换乘站
-tmp_counts = stop.groupby(['ostop'])['linename'].count().rename('count').reset_index()
-
-# 筛选出出现次数大于1的站点（即换乘站）
-transfer_stops_names = tmp_counts[tmp_counts['count'] > 1]['ostop']
-
-# 筛选出原始 stop 数据中属于换乘站的行
-tmp = pd.merge(stop, transfer_stops_names.to_frame(), on='ostop') # 合并以筛选
-
-# 提取换乘站的 原始站点名(ostop), 线路(line), 唯一站点名(station)，并去重
-tmp = tmp[['ostop', 'line', 'station']].drop_duplicates()
-
-# 对换乘站信息进行自连接，以找出同一物理站点在不同线路上的表示
-tmp = pd.merge(tmp, tmp, on='ostop')
-
-# 提取换乘边：当两条记录属于同一个物理站点但线路不同时
-edge2 = tmp[tmp['line_x'] != tmp['line_y']][['station_x', 'station_y']].copy() # 使用 .copy()
-edge2.columns = ['ostation', 'dstation'] # 重命名列以匹配edge1
-# 给换乘边添加权重，假定换乘耗时为5分钟
-edge2['duration'] = 5
-print(f"换乘边构建完成，共 {len(edge2)} 条。")
-
-# --- 合并边并构建网络 ---
-print("合并边并构建网络...")
-# 将轨道边和换乘边合并
-edge = pd.concat([edge1, edge2], ignore_index=True)
-print(f"总边数：{len(edge)}")
-
-# 提取网络中的所有唯一节点
-all_nodes = pd.concat([edge['ostation'], edge['dstation']]).unique()
-node = list(all_nodes)
-print(f"总节点数：{len(node)}")
-
-# 创建一个空图
-G = nx.Graph()
-# 添加节点
-G.add_nodes_from(node)
-# 添加带权重的无向边
-G.add_weighted_edges_from(edge[['ostation', 'dstation', 'duration']].values)
-print("NetworkX 图构建完成。")
+print(f"总边数：{len(graph.duration) // 2}")
+print(f"总节点数：{len(graph)}")
 
 # --- 读取和处理IC卡刷卡数据 ---
 print("读取和处理IC卡数据...")
-try:
-    icdata = pd.read_csv(r'data/icdata-sample.csv', header=None)
-    print("成功读取 'data/icdata-sample.csv'")
-except FileNotFoundError:
-    print("错误：找不到文件 'data/icdata-sample.csv'。请确保文件存在于 'data' 子目录中。")
-    exit()
-
-icdata.columns = ['cardid', 'date', 'time', 'station', 'mode', 'price', 'type']
-
-# 提取其中地铁刷卡部分
-metrodata = icdata[icdata['mode'] == '地铁'].copy() # 使用 .copy()
-# 按卡号时间排序
-metrodata = metrodata.sort_values(by=['cardid', 'date', 'time'])
-# 将数据整体往上移一行赋值给新的列
-for i in metrodata.columns:
-    metrodata[i + '1'] = metrodata[i].shift(-1)
-# 每条出行只保留一条记录 (进站价格为0，出站价格大于0)
-metrood = metrodata[(metrodata['cardid'] == metrodata['cardid1']) &
-                    (metrodata['price'] == 0) &
-                    (metrodata['price1'] > 0)].copy() # 使用 .copy()
-
-# 提取起终点的线路和站点
-metrood['oline'] = metrood['station'].apply(lambda r: r[:(r.find('线') + 1)])
-metrood['ostation_name'] = metrood['station'].apply(lambda r: r[(r.find('线') + 1):]) # 临时存储原始站名
-metrood['dline'] = metrood['station1'].apply(lambda r: r[:(r.find('线') + 1)])
-metrood['dstation_name'] = metrood['station1'].apply(lambda r: r[(r.find('线') + 1):]) # 临时存储原始站名
-
-# 保留有用的列，并重命名列
-metrood = metrood[['cardid', 'date', 'time', 'station', 'oline', 'ostation_name', 'time1', 'station1', 'dline', 'dstation_name']]
-metrood.columns = ['cardid', 'date', 'otime', 'ostation_raw', 'oline', 'ostop', 'dtime', 'dstation_raw', 'dline', 'dstop']
-
-# --- 修正IC卡数据中的站点名称 ---
-print("修正IC卡数据中的站点名称...")
-corrections = {
-    '淞浜路': '淞滨路',
-    '上海大学站': '上海大学',
-    '上海野生动物园': '野生动物园',
-    '外高桥保税区北': '外高桥保税区北站',
-    '外高桥保税区南': '外高桥保税区南站',
-    '李子园路': '李子园'
-}
-metrood['ostop'] = metrood['ostop'].replace(corrections)
-metrood['dstop'] = metrood['dstop'].replace(corrections)
-
-# 字符串左右去除空格
-metrood['ostop'] = metrood['ostop'].str.strip()
-metrood['dstop'] = metrood['dstop'].str.strip()
-
-# 构建修正后的站点名称（带线路名称），用于匹配网络节点
-metrood['ostation'] = metrood['oline'] + metrood['ostop']
-metrood['dstation'] = metrood['dline'] + metrood['dstop']
+# 首次运行时分块读取刷卡数据，配对进出站后写入 Parquet 文件，之后直接读取配对结果
+if not os.path.exists(METROOD_PARQUET):
+    try:
+        ntrips = chain_metro_trips(r'data/icdata-sample.csv', METROOD_PARQUET)
+        print(f"成功处理 'data/icdata-sample.csv'，共 {ntrips} 条地铁出行")
+    except FileNotFoundError:
+        print("错误：找不到文件 'data/icdata-sample.csv'。请确保文件存在于 'data' 子目录中。")
+        exit()
+metrood = pd.read_parquet(METROOD_PARQUET)
+
+# --- 站点名称转换为站点编号 ---
+print("刷卡站点名称转换为网络站点编号...")
+# 站点字典：每个不同的刷卡站点字符串只做一次修正与匹配，查找表缓存在 data/cache 中，
+# 之后的 OD 去重、路径匹配与断面汇总均使用 int32 站点编号，不在网络中的站点为 -1
+stations = StationDictionary(graph)
+metrood['o'] = stations.encode(metrood['ostation_raw'])
+metrood['d'] = stations.encode(metrood['dstation_raw'])
+stations.save()
+
+# 未匹配站点报告：按涉及的出行次数排序，便于补充站名修正表
+unmatched = unmatched_report(pd.concat([metrood['ostation_raw'], metrood['dstation_raw']], ignore_index=True),
+                             np.r_[metrood['o'], metrood['d']])
+if len(unmatched) > 0:
+    print(f"有 {len(unmatched)} 个刷卡站点未能匹配到网络站点，涉及 {int(unmatched['trips'].sum())} 次进出站：")
+    print(unmatched.head(10).to_string(index=False))
+    unmatched.to_csv(r'data/unmatched_stations.csv', index=None, encoding='utf-8-sig')
+    print("未匹配站点已保存到 'data/unmatched_stations.csv'")
+
+# 修正后的站点名称（带线路名称），由站点编号还原
+metrood['ostation'] = stations.decode(metrood['o'])
+metrood['dstation'] = stations.decode(metrood['d'])
 
 # 保存处理后的OD数据
 try:
@@ -156,93 +83,77 @@ except Exception as e:
 
 # --- 计算最短路径 ---
 print("计算OD对的最短路径...")
-# 获取去重后的OD对
-od_distinct = metrood[['ostation', 'dstation']].drop_duplicates().copy() # 使用 .copy()
-
-# 定义一个函数来安全地计算路径，处理可能找不到节点的情况
-def get_shortest_path(graph, source, target, weight):
-    try:
-        # 检查节点是否存在于图中
-        if source not in graph:
-            # print(f"警告: 起点 '{source}' 不在图中。")
-            return None
-        if target not in graph:
-            # print(f"警告: 终点 '{target}' 不在图中。")
-            return None
-        # 计算最短路径
-        return nx.shortest_path(graph, source=source, target=target, weight=weight)
-    except nx.NetworkXNoPath:
-        # print(f"警告: 无法找到从 '{source}' 到 '{target}' 的路径。")
-        return None
-    except Exception as e:
-        print(f"计算路径时发生错误 ({source} -> {target}): {e}")
-        return None
-
-# 对去重后的OD遍历，得到每条OD的出行路径
-# **重要修正**: weight参数应为 'duration'
-od_distinct['path'] = od_distinct.apply(
-    lambda r: get_shortest_path(G, source=r['ostation'], target=r['dstation'], weight='duration'),
-    axis=1
-)
-
-# 过滤掉没有找到路径的OD对
-od_distinct = od_distinct.dropna(subset=['path'])
+# 获取去重后的OD对：起终点编号合成一个 int64 键后去重，trip_od 为每条出行对应的去重OD序号
+valid = ((metrood['o'] >= 0) & (metrood['d'] >= 0)).to_numpy()
+key = metrood['o'].to_numpy(dtype=np.int64)[valid] * len(graph) + metrood['d'].to_numpy()[valid]
+od_key, trip_od = np.unique(key, return_inverse=True)
+od_distinct = pd.DataFrame({'o': (od_key // len(graph)).astype(np.int32), 'd': (od_key % len(graph)).astype(np.int32)})
+
+# 按起点分组，每个起点只做一次 Dijkstra，各终点的路径由前驱数组回溯得到
+cost, offsets, nodes = od_shortest_paths(graph, od_distinct['o'].to_numpy(), od_distinct['d'].to_numpy(),
+                                         processes=PROCESSES)
+reachable = np.isfinite(cost)
+od_distinct = od_distinct[reachable].reset_index(drop=True)
+offsets = np.r_[0, np.cumsum(np.diff(offsets)[reachable])]
 print(f"为 {len(od_distinct)} 条有效OD对计算了最短路径。")
 
-# --- 构建OD路径分段表 ---
-print("构建OD路径分段表...")
-# 先创建空的list
-ls = []
-# 遍历有路径的OD对
-for i in range(len(od_distinct)):
-    # 获取其中的一行
-    r = od_distinct.iloc[i]
-    # 对这一行的路径构建轨道段的表
-    path_nodes = r['path']
-    if len(path_nodes) > 1: # 路径至少需要2个节点才能构成段
-        tmp = pd.DataFrame({'o': path_nodes[:-1], 'd': path_nodes[1:]})
-        # 对这个表添加O和D列
-        tmp['ostation'] = r['ostation']
-        tmp['dstation'] = r['dstation']
-        # 将这个表添加到空list里
-        ls.append(tmp)
-
-# 合并list里面的表，变成一个大的出行路径表
-if ls: # 检查列表是否为空
-    od_path = pd.concat(ls)
-    print(f"OD路径分段表构建完成，共 {len(od_path)} 个路段。")
-    # 保存
-    try:
-        od_path.to_csv(r'data/od_path.csv', index=None, encoding='utf-8-sig')
-        print("路径分段数据已保存到 'data/od_path.csv'")
-    except Exception as e:
-        print(f"保存 'data/od_path.csv' 时出错: {e}")
+# 每条出行对应的OD行号，站点未匹配或没有有效路径的为 -1
+od_row = np.where(reachable, np.cumsum(reachable) - 1, -1)
+trip_row = np.full(len(metrood), -1, dtype=np.int64)
+trip_row[valid] = od_row[trip_od]
+
+# --- 构建OD路径关联矩阵 ---
+print("构建OD路径关联矩阵...")
+# 行为OD对、列为轨道段（有向边）；单一路径分配时路径经过的轨道段为 1，
+# 多路径分配时为 OD 经过该轨道段的概率（各路径按 Logit 模型分担需求）
+if ASSIGNMENT == 'logit':
+    path_od, path_cost, path_offsets, path_nodes = k_shortest_paths(graph, od_distinct['o'], od_distinct['d'],
+                                                                     processes=PROCESSES)
+    incidence, path_prob = logit_incidence(graph, path_od, path_cost, path_offsets, path_nodes, len(od_distinct))
+    print(f"多路径分配：{len(od_distinct)} 条OD对共 {len(path_od)} 条路径。")
 else:
-    print("警告：未能生成任何有效的OD路径分段。后续分析可能无法进行。")
-    od_path = pd.DataFrame(columns=['o', 'd', 'ostation', 'dstation']) # 创建空DataFrame以避免后续错误
-
-
-# --- 分析8点断面客流 ---
-print("开始分析8点断面客流...")
-# 确保 od_path 存在且不为空
-if not od_path.empty:
-    # 为OD添加小时的列
-    metrood['Hour'] = metrood['otime'].apply(lambda r: r.split(':')[0])
-
-    # 提取8点的OD，并将OD与出行路径表连接
-    trips_08 = metrood[metrood['Hour'] == '08'].copy() # 使用 .copy()
-    print(f"提取到 {len(trips_08)} 条8点出发的行程。")
-
-    # 使用 inner merge，只保留那些成功计算了路径的行程
-    tmp = pd.merge(trips_08, od_path, on=['ostation', 'dstation'])
-    print(f"合并行程与路径后，得到 {len(tmp)} 条有效路径段记录。")
-
-
-    # 集计得到每个轨道段的客流量
-    if not tmp.empty:
-        metro_passenger = tmp.groupby(['o', 'd'])['cardid'].count().rename('count').reset_index()
-
-        print(f"计算得到 {len(metro_passenger)} 个轨道段的8点客流量。")
+    incidence = path_incidence(graph, offsets, nodes)
+print(f"OD路径关联矩阵构建完成，共 {incidence.nnz} 个路段。")
+# 保存
+try:
+    save_od_paths(r'data/od_path.npz', incidence, od_distinct['o'], od_distinct['d'])
+    print("路径关联矩阵已保存到 'data/od_path.npz'")
+except Exception as e:
+    print(f"保存 'data/od_path.npz' 时出错: {e}")
+
+
+# --- 分析全天分时段断面客流 ---
+print("开始分析全天分时段断面客流...")
+# 确保关联矩阵不为空
+if incidence.nnz > 0:
+    print(f"共 {len(metrood)} 条行程，其中 {int((trip_row >= 0).sum())} 条有有效路径。")
+
+    # 按出发时间分时间片，一次计算全天 时间片 × 轨道段 的客流量并保存
+    cube = flow_cube(incidence, trip_row, time_to_seconds(metrood['otime']), BIN_MINUTES)
+    save_flow_cube(FLOW_CUBE_PATH, cube, graph, BIN_MINUTES)
+    print(f"全天断面客流已保存到 '{FLOW_CUBE_PATH}'，共 {cube.shape[0]} 个时间片")
+
+    # 分钟级在网客流：按进出站时刻估计每条出行进入各轨道段的时刻，得到全天 分钟 × 轨道段 的在车人数，
+    # 路径与断面客流一致：多路径分配时每条出行按选择概率分到各条路径上
+    if ASSIGNMENT == 'logit':
+        edge_offsets, edges = path_edges(graph, path_offsets, path_nodes)
+        load = load_profile(graph, edge_offsets, edges, trip_row,
+                            time_to_seconds(metrood['otime']), time_to_seconds(metrood['dtime']),
+                            path_od=path_od, prob=path_prob)
+    else:
+        edge_offsets, edges = path_edges(graph, offsets, nodes)
+        load = load_profile(graph, edge_offsets, edges, trip_row,
+                            time_to_seconds(metrood['otime']), time_to_seconds(metrood['dtime']))
+    save_flow_cube(LOAD_PROFILE_PATH, load, graph, bin_minutes=1)
+    peak_minute, peak_edge = np.unravel_index(np.argmax(load), load.shape)
+    print(f"分钟级在网客流已保存到 '{LOAD_PROFILE_PATH}'，最拥挤的轨道段为 "
+          f"{graph.stations[graph.edge_o[peak_edge]]}-{graph.stations[graph.edge_d[peak_edge]]}，"
+          f"{peak_minute // 60:02d}:{peak_minute % 60:02d} 在车 {load[peak_minute, peak_edge]:.0f} 人")
+
+    # 取指定时刻所在时间片的断面客流
+    metro_passenger = flow_slice(load_flow_cube(FLOW_CUBE_PATH), PLOT_TIME)
+    if len(metro_passenger) > 0:
+        print(f"计算得到 {len(metro_passenger)} 个轨道段的{PLOT_TIME}时段客流量。")
 
         # 保存 metro_passenger 数据到 CSV 文件
         try:
@@ -261,8 +172,7 @@ if not od_path.empty:
         # 但最佳实践是重新过滤原始数据
         try:
             stop_orig = pd.read_csv(r'data/stop.csv') # 重新加载以获取干净数据
-            stop_orig['line'] = stop_orig['linename'].apply(lambda r: r.split('(')[0].lstrip('地铁'))
-            stop_orig.loc[stop_orig['line'] == '5号线支线', 'line'] = '5号线'
+            stop_orig['line'] = line_of(stop_orig['linename'])
             linestop_base = stop_orig[stop_orig['line'] == linename].copy()
         except FileNotFoundError:
             print("错误：无法重新读取 'data/stop.csv' 以获取线路信息。")
@@ -372,7 +282,7 @@ if not od_path.empty:
             plt.yticks(locs, abs(locs.astype(int)))
 
             # 定义图名
-            plt.title(f'{linename} 8时断面客流')
+            plt.title(f'{linename} {PLOT_TIME}时段断面客流')
             plt.tight_layout() # 调整布局防止标签重叠
 
             # 确保“图片”文件夹存在
@@ -380,7 +290,7 @@ if not od_path.empty:
             os.makedirs(output_folder, exist_ok=True)  # 如果文件夹不存在则创建
 
             # 保存为 SVG 格式
-            svg_filename = os.path.join(output_folder, f'{linename}_8时断面客流.svg')
+            svg_filename = os.path.join(output_folder, f'{linename}_{PLOT_TIME.replace(":", "")}时段断面客流.svg')
             plt.savefig(svg_filename, format='svg')  # 保存为 SVG 文件
             print(f"断面客流图已保存为 SVG 文件：{svg_filename}")
 
@@ -392,6 +302,6 @@ if not od_path.empty:
         print("警告：没有计算出有效的轨道段客流量，无法绘制断面图。")
 
 else:
-    print("警告：OD路径分段表为空，无法进行客流分析和绘图。")
+    print("警告：OD路径关联矩阵为空，无法进行客流分析和绘图。")
 
 print("脚本执行完毕。")
\ No newline at end of file
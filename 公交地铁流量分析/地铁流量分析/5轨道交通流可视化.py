@@ -8,6 +8,11 @@ import matplotlib
 import os
 import warnings
 
+from 客流分配 import FLOW_CUBE_PATH, flow_slice, load_flow_cube
+
+# 绘图选取的时刻：从全天断面客流（data/flow_cube.npz）中取该时刻所在的时间片
+PLOT_TIME = '08:00'
+
 # 忽略警告
 warnings.filterwarnings("ignore")
 
@@ -27,7 +32,11 @@ tbd.set_imgsavepath(imgsavepath)
 
 # 读取轨道站点数据
 stop = pd.read_csv(r'data/stop.csv')
-metro_passenger = pd.read_csv(r'data/metro_passenger.csv')
+# 断面客流：优先从全天断面客流中取指定时间片，没有时读取 4断面客流分布.py 保存的单时段客流
+if os.path.exists(FLOW_CUBE_PATH):
+    metro_passenger = flow_slice(load_flow_cube(FLOW_CUBE_PATH), PLOT_TIME)
+else:
+    metro_passenger = pd.read_csv(r'data/metro_passenger.csv')
 
 # 为站点生成 geometry 列，存储地理信息
 stop['geometry'] = geopandas.points_from_xy(stop['lon'], stop['lat'])
@@ -188,7 +197,7 @@ metro_line_parallel.plot(
 plt.axis('off')
 ax4.set_xlim(bounds[0], bounds[2] - 0.1)
 ax4.set_ylim(bounds[1] + 0.05, bounds[3] - 0.1)
-plt.title('早高峰8时客流量')
+plt.title(f'{PLOT_TIME}时段客流量')
 
 # 加比例尺和指北针
 tbd.plotscale(ax4, bounds=bounds, textsize=10, compasssize=1, accuracy=1000, rect=[0.06, 0.13], zorder=10)
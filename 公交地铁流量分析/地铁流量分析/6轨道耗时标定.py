@@ -0,0 +1,75 @@
+# 导入所需库
+import os
+
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+
+from 客流分配 import time_to_seconds
+from 刷卡数据 import METROOD_PARQUET, StationDictionary, chain_metro_trips
+from 耗时标定 import CALIBRATED_EDGE_PATH, TIME_BANDS, band_table, calibrate_durations, save_calibrated_edges
+from 轨道网络 import load_metro_graph, script_processes
+
+# 最短路计算的进程数：本脚本没有 if __name__ == '__main__' 保护，只在以 fork 方式创建子进程时使用进程池
+PROCESSES = script_processes()
+
+# 设置 Matplotlib 显示中文和负号
+plt.rcParams['font.sans-serif'] = ['SimHei']
+plt.rcParams['font.serif'] = ['SimHei']
+plt.rcParams['axes.unicode_minus'] = False
+
+# --- 读取轨道网络（先验耗时：每站 3 分钟、换乘 5 分钟） ---
+try:
+    graph = load_metro_graph(r'data/stop.csv')
+    print("成功读取轨道网络")
+except FileNotFoundError:
+    print("错误：找不到文件 'data/stop.csv'。请确保文件存在于 'data' 子目录中。")
+    exit()
+
+# --- 读取地铁出行 ---
+if not os.path.exists(METROOD_PARQUET):
+    try:
+        ntrips = chain_metro_trips(r'data/icdata-sample.csv', METROOD_PARQUET)
+        print(f"成功处理 'data/icdata-sample.csv'，共 {ntrips} 条地铁出行")
+    except FileNotFoundError:
+        print("错误：找不到文件 'data/icdata-sample.csv'。请确保文件存在于 'data' 子目录中。")
+        exit()
+metrood = pd.read_parquet(METROOD_PARQUET, columns=['otime', 'ostation_raw', 'dtime', 'dstation_raw'])
+stations = StationDictionary(graph)
+o = stations.encode(metrood['ostation_raw'])
+d = stations.encode(metrood['dstation_raw'])
+stations.save()
+
+# --- 标定轨道段耗时与换乘耗时 ---
+print("由进出站刷卡时间标定轨道段耗时...")
+result = calibrate_durations(graph, o, d, time_to_seconds(metrood['otime']), time_to_seconds(metrood['dtime']),
+                             bands=TIME_BANDS, processes=PROCESSES)
+transfer = graph.transfer_arcs()
+observed = result['trips'] > 0
+print(f"进出站耗时 {result['access']:.1f} 分钟；有出行经过的有向边 {int(observed.sum())}/{len(observed)} 条")
+print(f"区间平均耗时 {result['duration'][~transfer & observed].mean():.2f} 分钟，"
+      f"换乘平均耗时 {result['duration'][transfer & observed].mean():.2f} 分钟")
+
+# 标定结果写回网络并保存边表，4断面客流分布.py 等脚本检测到该文件时使用标定后的耗时
+save_calibrated_edges(graph, result['duration'], CALIBRATED_EDGE_PATH)
+print(f"标定后的边表已保存到 '{CALIBRATED_EDGE_PATH}'")
+bands = band_table(graph, result)
+bands.to_csv(r'data/edge_duration_bands.csv', index=None, encoding='utf-8-sig')
+print("分时段标定结果已保存到 'data/edge_duration_bands.csv'")
+for k in range(len(TIME_BANDS) - 1):
+    print(f"{TIME_BANDS[k]:02d}-{TIME_BANDS[k + 1]:02d} 时：{result['band_trips'][k]} 次出行，"
+          f"区间平均耗时 {result['band_duration'][k][~transfer & observed].mean():.2f} 分钟")
+
+# --- 绘制标定耗时分布 ---
+fig = plt.figure(1, (8, 4), dpi=250)
+ax = plt.subplot(111)
+bins = np.arange(0, np.ceil(result['duration'].max()) + 0.5, 0.5)
+plt.hist(result['duration'][~transfer & observed], bins=bins, alpha=0.7, label='区间')
+plt.hist(result['duration'][transfer & observed], bins=bins, alpha=0.7, label='换乘')
+plt.legend()
+plt.xlabel('耗时（分钟）')
+plt.ylabel('边数')
+plt.title('轨道区间与换乘耗时标定结果')
+os.makedirs('图片', exist_ok=True)
+plt.savefig(os.path.join('图片', '轨道耗时标定.svg'), format='svg')
+print("标定耗时分布图已保存到 '图片/轨道耗时标定.svg'")
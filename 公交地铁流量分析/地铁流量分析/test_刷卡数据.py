@@ -0,0 +1,61 @@
+import pandas as pd
+
+import 刷卡数据
+from 刷卡数据 import chain_metro_trips
+
+
+def _write(path, rows):
+    pd.DataFrame(rows).to_csv(path, header=False, index=False)
+
+
+# 按卡号排序的文件中，出行跨越分块边界时仍能配对
+def test_trip_across_chunks_card_sorted(tmp_path):
+    csv_path = tmp_path / 'icdata.csv'
+    _write(csv_path, [
+        ['A', '2015-04-01', '20:00:00', '1号线人民广场', '地铁', 0, '非优惠'],
+        ['A', '2015-04-01', '20:30:00', '2号线静安寺', '地铁', 3, '非优惠'],
+        ['B', '2015-04-01', '08:00:00', '1号线莘庄', '地铁', 0, '非优惠'],
+        ['B', '2015-04-01', '08:30:00', '1号线徐家汇', '地铁', 4, '非优惠'],
+        ['C', '2015-04-01', '07:00:00', '2号线静安寺', '地铁', 0, '非优惠'],
+        ['C', '2015-04-01', '12:00:00', '2号线人民广场', '地铁', 3, '非优惠'],
+    ])
+    out_path = tmp_path / 'metrood.parquet'
+    assert chain_metro_trips(str(csv_path), str(out_path), chunksize=3) == 2
+
+    trips = pd.read_parquet(out_path)
+    assert trips['cardid'].tolist() == ['A', 'B']
+    assert trips['otime'].tolist() == ['20:00:00', '08:00:00']
+    assert trips['dtime'].tolist() == ['20:30:00', '08:30:00']
+    assert trips['dstop'].tolist() == ['静安寺', '徐家汇']
+
+
+# 没有出站的进站记录在超过 max_duration 后不再带入下一块，带入的记录数不随文件增长，配对结果不变
+def test_orphan_tap_in_not_carried_forever(tmp_path, monkeypatch):
+    rows = [['X', '2015-04-01', '05:00:00', '1号线莘庄', '地铁', 0, '非优惠']]
+    for k in range(40):
+        t = pd.Timestamp('2015-04-01 05:30') + pd.Timedelta(minutes=30 * k)
+        rows += [[f'A{k:02d}', t.strftime('%Y-%m-%d'), t.strftime('%H:%M:%S'), '1号线人民广场', '地铁', 0, '非优惠'],
+                 [f'A{k:02d}', t.strftime('%Y-%m-%d'), (t + pd.Timedelta(minutes=20)).strftime('%H:%M:%S'),
+                  '2号线静安寺', '地铁', 3, '非优惠'],
+                 [f'B{k:02d}', t.strftime('%Y-%m-%d'), t.strftime('%H:%M:%S'), '1号线徐家汇', '地铁', 0, '非优惠']]
+    rows.sort(key=lambda r: (r[1], r[2]))
+    csv_path = tmp_path / 'icdata.csv'
+    _write(csv_path, rows)
+
+    sizes = []
+    pair_trips = 刷卡数据.pair_trips
+
+    def record(chunk, max_duration):
+        sizes.append(len(chunk))
+        return pair_trips(chunk, max_duration)
+
+    monkeypatch.setattr(刷卡数据, 'pair_trips', record)
+    assert chain_metro_trips(str(csv_path), str(tmp_path / 'chunked.parquet'), chunksize=3) == 40
+    # 每块 3 条记录，带入的进站记录只来自最近 max_duration（4 小时）内的块
+    assert max(sizes) <= 3 + 2 * 9
+    monkeypatch.undo()
+
+    assert chain_metro_trips(str(csv_path), str(tmp_path / 'whole.parquet'), chunksize=len(rows)) == 40
+    chunked = pd.read_parquet(tmp_path / 'chunked.parquet').sort_values(by='cardid').reset_index(drop=True)
+    whole = pd.read_parquet(tmp_path / 'whole.parquet').sort_values(by='cardid').reset_index(drop=True)
+    pd.testing.assert_frame_equal(chunked, whole)
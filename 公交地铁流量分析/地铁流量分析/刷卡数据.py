@@ -0,0 +1,171 @@
+import hashlib
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from 轨道网络 import CACHE_DIR
+
+# 原始 IC 卡刷卡数据的列名与类型
+ICDATA_COLUMNS = ['cardid', 'date', 'time', 'station', 'mode', 'price', 'type']
+ICDATA_DTYPES = {
+    'cardid': str,
+    'date': str,
+    'time': str,
+    'station': str,
+    'mode': str,
+    'price': 'float32',
+    'type': str,
+}
+
+# 地铁出行（进出站配对后的 OD）保存路径与列类型
+METROOD_PARQUET = r'data/metrood.parquet'
+METROOD_SCHEMA = pa.schema([
+    ('cardid', pa.string()),
+    ('date', pa.string()),
+    ('otime', pa.string()),
+    ('ostation_raw', pa.string()),
+    ('oline', pa.string()),
+    ('ostop', pa.string()),
+    ('dtime', pa.string()),
+    ('dstation_raw', pa.string()),
+    ('dline', pa.string()),
+    ('dstop', pa.string()),
+])
+# 进站到出站的最长时间（秒），超过的进站记录视为没有出站
+MAX_TRIP_DURATION = 4 * 3600
+
+
+# 刷卡站点字符串切分为线路与站点：第一个"线"字及之前为线路，之后为站点，没有"线"字时线路为空
+def split_station(station):
+    parts = station.str.extract(r'^([^线]*线)?(.*)$')
+    return parts[0].fillna(''), parts[1]
+
+
+# 刷卡记录的时刻（距 1970 年的秒数）
+def tap_seconds(rows):
+    return (pd.to_datetime(rows['date'])
+            + pd.to_timedelta(rows['time'])).to_numpy().astype('datetime64[s]').astype(np.int64)
+
+
+# 一块刷卡记录内的出行配对：按卡号、时间排序后，同一张卡相邻的进站（价格为 0）与出站（价格大于 0）记录构成一次出行
+# 返回配对出行与需要带入下一块的记录（各卡最后一条为进站的记录，其出站记录可能在下一块）
+def pair_trips(rows, max_duration=MAX_TRIP_DURATION):
+    rows = rows.sort_values(by=['cardid', 'date', 'time'], kind='stable').reset_index(drop=True)
+    cardid = rows['cardid'].to_numpy()
+    price = rows['price'].to_numpy()
+    seconds = tap_seconds(rows)
+
+    same_card = np.r_[cardid[1:] == cardid[:-1], False]
+    gap = np.r_[seconds[1:] - seconds[:-1], 0]
+    tap_in = price == 0
+    is_trip = same_card & tap_in & np.r_[price[1:] > 0, False] & (gap >= 0) & (gap <= max_duration)
+    i = np.flatnonzero(is_trip)
+
+    oline, ostop = split_station(rows['station'].iloc[i])
+    dline, dstop = split_station(rows['station'].iloc[i + 1])
+    trips = pd.DataFrame({
+        'cardid': cardid[i],
+        'date': rows['date'].to_numpy()[i],
+        'otime': rows['time'].to_numpy()[i],
+        'ostation_raw': rows['station'].to_numpy()[i],
+        'oline': oline.to_numpy(),
+        'ostop': ostop.to_numpy(),
+        'dtime': rows['time'].to_numpy()[i + 1],
+        'dstation_raw': rows['station'].to_numpy()[i + 1],
+        'dline': dline.to_numpy(),
+        'dstop': dstop.to_numpy(),
+    })
+
+    # 各卡最后一条记录若为进站，带入下一块继续配对；输入只按卡号排序时块内时间不单调，
+    # 因此不按块内最晚时刻筛选，过期的记录由 chain_metro_trips 按下一块的最早时刻丢弃
+    carry = rows[~same_card & tap_in]
+    return trips, carry
+
+
+# 分块读取 IC 卡刷卡数据，筛选地铁刷卡并配对进出站，结果逐块追加写入 Parquet 文件
+# 块末尾尚未出站的卡带入下一块；进站时刻比下一块最早的刷卡还早 max_duration 以上的带入记录不可能再配对，
+# 读入下一块时丢弃，没有出站的进站记录不会一直累积，内存占用只取决于 chunksize 与 max_duration 内的在途卡数
+def chain_metro_trips(csv_path=r'data/icdata-sample.csv', out_path=METROOD_PARQUET, chunksize=5000000,
+                      max_duration=MAX_TRIP_DURATION):
+    reader = pd.read_csv(csv_path, header=None, names=ICDATA_COLUMNS, dtype=ICDATA_DTYPES, chunksize=chunksize)
+    carry = pd.DataFrame({c: pd.Series(dtype=t) for c, t in ICDATA_DTYPES.items()})
+    ntrips = 0
+    os.makedirs(os.path.dirname(out_path) or '.', exist_ok=True)
+    with pq.ParquetWriter(out_path, METROOD_SCHEMA) as writer:
+        for chunk in reader:
+            chunk = chunk[chunk['mode'] == '地铁']
+            if len(carry) and len(chunk):
+                carry = carry[tap_seconds(carry) >= tap_seconds(chunk).min() - max_duration]
+            trips, carry = pair_trips(pd.concat([carry, chunk], ignore_index=True), max_duration)
+            writer.write_table(pa.Table.from_pandas(trips, schema=METROOD_SCHEMA, preserve_index=False))
+            ntrips += len(trips)
+    return ntrips
+
+
+# 刷卡数据中站点名称的修正：刷卡系统中的站名 -> 轨道站点数据中的站名
+STATION_CORRECTIONS = {
+    '淞浜路': '淞滨路',
+    '上海大学站': '上海大学',
+    '上海野生动物园': '野生动物园',
+    '外高桥保税区北': '外高桥保税区北站',
+    '外高桥保税区南': '外高桥保税区南站',
+    '李子园路': '李子园'
+}
+
+
+# 刷卡站点字符串规范化为网络中的站点名称（线路名+站点名）：切分线路与站点、修正站名、去除空格
+def normalize_station(station, corrections=STATION_CORRECTIONS):
+    line, stop = split_station(pd.Series(station))
+    return line.str.strip() + stop.str.strip().replace(corrections).str.strip()
+
+
+# 站点字典：刷卡站点字符串到网络站点编号（int32，未匹配为 -1）的查找表
+# 每个不同的刷卡字符串只规范化、查找一次；查找表保存在 cache_dir 中，以网络站点与修正表的哈希值区分
+class StationDictionary:
+    def __init__(self, graph, corrections=STATION_CORRECTIONS, cache_dir=CACHE_DIR):
+        self.graph = graph
+        self.corrections = corrections
+        h = hashlib.sha1('\n'.join(graph.stations).encode('utf-8'))
+        h.update(repr(sorted(corrections.items())).encode('utf-8'))
+        self.cache_path = os.path.join(cache_dir, f'station_lookup_{h.hexdigest()[:16]}.parquet')
+        if os.path.exists(self.cache_path):
+            table = pd.read_parquet(self.cache_path)
+            self.lookup = pd.Series(table['id'].to_numpy(dtype=np.int32), index=table['raw'].to_numpy())
+        else:
+            self.lookup = pd.Series(dtype=np.int32)
+        self._changed = False
+
+    # 刷卡站点字符串转换为站点编号
+    def encode(self, station):
+        codes, uniques = pd.factorize(pd.Series(station), use_na_sentinel=True)
+        uniques = pd.Index(uniques)
+        new = uniques[~uniques.isin(self.lookup.index)]
+        if len(new):
+            ids = self.graph.index(normalize_station(new.to_numpy(), self.corrections)).astype(np.int32)
+            self.lookup = pd.concat([self.lookup, pd.Series(ids, index=new.to_numpy())])
+            self._changed = True
+        table = np.r_[self.lookup.reindex(uniques).to_numpy(dtype=np.int32), np.int32(-1)]
+        # 缺失值的编码为 -1，对应表末尾的 -1
+        return table[codes]
+
+    # 站点编号转换为网络中的站点名称，-1 为缺失值
+    def decode(self, ids):
+        return pd.Categorical.from_codes(ids, categories=self.graph.stations)
+
+    def save(self):
+        if self._changed:
+            os.makedirs(os.path.dirname(self.cache_path), exist_ok=True)
+            pd.DataFrame({'raw': self.lookup.index.astype(str), 'id': self.lookup.to_numpy()}).to_parquet(
+                self.cache_path, index=False)
+            self._changed = False
+
+
+# 未匹配站点报告：无法对应到网络站点的刷卡站点字符串、规范化后的名称及涉及的出行次数
+def unmatched_report(station, ids, corrections=STATION_CORRECTIONS):
+    station = pd.Series(station)[np.asarray(ids) < 0]
+    report = station.value_counts().rename_axis('station_raw').rename('trips').reset_index()
+    report.insert(1, 'station', normalize_station(report['station_raw'], corrections).to_numpy())
+    return report
@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from 轨道网络 import path_incidence
+
+# 断面客流时间片长度（分钟）
+BIN_MINUTES = 60
+# 断面客流立方体的保存路径
+FLOW_CUBE_PATH = r'data/flow_cube.npz'
+# 多路径 Logit 分配的离散参数（1/分钟）：路径费用每多 1 分钟，选择概率约降为 exp(-LOGIT_THETA) 倍
+LOGIT_THETA = 0.3
+# 分钟级在网客流的保存路径（格式与断面客流立方体相同，时间片为 1 分钟）
+LOAD_PROFILE_PATH = r'data/load_profile.npz'
+
+
+# 时间字符串（HH:MM:SS）转换为当天的秒数
+def time_to_seconds(time):
+    return pd.to_timedelta(pd.Series(time).astype(str)).dt.total_seconds().to_numpy()
+
+
+# 全天分时段断面客流：每条出行按出发时间归入 bin_minutes 分钟的时间片，
+# 组成 OD × 时间片 的稀疏需求矩阵后与关联矩阵相乘，一次得到 时间片 × 轨道段 的客流量
+# od_row 为每条出行对应关联矩阵的行号（-1 为无有效路径），seconds 为出发时刻距当天 0 点的秒数
+def flow_cube(incidence, od_row, seconds, bin_minutes=BIN_MINUTES):
+    n_bins = int(np.ceil(24 * 60 / bin_minutes))
+    tbin = np.clip((np.asarray(seconds) // (bin_minutes * 60)).astype(np.int64), 0, n_bins - 1)
+    od_row = np.asarray(od_row)
+    valid = od_row >= 0
+    demand = csr_matrix((np.ones(valid.sum()), (od_row[valid], tbin[valid])), shape=(incidence.shape[0], n_bins))
+    flows = (incidence.T @ demand).toarray().T
+    return np.rint(flows).astype(np.int32)
+
+
+# 保存断面客流立方体，同时保存各轨道段的起终点名称与时间片长度，读取时不再需要网络
+def save_flow_cube(path, cube, graph, bin_minutes=BIN_MINUTES):
+    np.savez_compressed(path, cube=cube, o=graph.stations[graph.edge_o], d=graph.stations[graph.edge_d],
+                        bin_minutes=bin_minutes)
+
+
+def load_flow_cube(path=FLOW_CUBE_PATH):
+    with np.load(path) as data:
+        return {k: data[k] for k in data.files}
+
+
+# 从断面客流立方体中取某一时刻（HH:MM）所在时间片的客流，返回与 metro_passenger.csv 相同格式的表（o, d, count）
+def flow_slice(cube, time):
+    bin_minutes = int(cube['bin_minutes'])
+    k = int(time_to_seconds([time if time.count(':') == 2 else time + ':00'])[0] // (bin_minutes * 60))
+    flows = pd.DataFrame({'o': cube['o'], 'd': cube['d'], 'count': cube['cube'][k]})
+    return flows[flows['count'] > 0].reset_index(drop=True)
+
+
+# 分钟级在网客流：按每条出行的进站、出站时刻与路径，估计其进入、离开每个轨道段的时刻，
+# 全程耗时按路径上各段的标定耗时比例分配；每个乘客在所在轨道段的起止分钟上分别 +1、-1，
+# 用 np.bincount 累加成差分数组后沿时间轴累加，得到 分钟 × 轨道段 的在车人数
+# edge_offsets、edges 为 path_edges 返回的各路径依次经过的边，od_row 为每条出行的 OD 序号（-1 为无有效路径），
+# oseconds、dseconds 为进站、出站时刻距当天 0 点的秒数；出行分块展开，内存占用与 chunksize 成正比
+# 单一路径分配时第 i 条路径即第 i 个 OD 的路径；多路径分配时给定 path_od（按 OD 排序）与 logit_incidence 返回的
+# 选择概率 prob，每条出行按概率分到其 OD 的各条路径上，结果为与断面客流一致的期望在车人数（float32）
+def load_profile(graph, edge_offsets, edges, od_row, oseconds, dseconds, path_od=None, prob=None,
+                 chunksize=1000000):
+    n_edges = len(graph.duration)
+    n_minutes = 24 * 60
+    # 各路径上每条边之前的累计耗时与路径总耗时
+    duration = graph.duration[edges]
+    cum = np.cumsum(duration)
+    before = cum - duration - np.repeat(np.r_[0, cum][edge_offsets[:-1]], np.diff(edge_offsets))
+    total = np.add.reduceat(np.r_[duration, 0], edge_offsets[:-1]) * (np.diff(edge_offsets) > 0)
+
+    od_row, oseconds, dseconds = np.asarray(od_row), np.asarray(oseconds), np.asarray(dseconds)
+    valid = np.flatnonzero((od_row >= 0) & (dseconds > oseconds))
+    # 各 OD 的路径范围：第 i 个 OD 的路径为 path_start[i]:path_start[i+1]
+    if path_od is None:
+        path_start = np.arange(len(edge_offsets))
+    else:
+        path_start = np.r_[0, np.cumsum(np.bincount(path_od, minlength=od_row.max(initial=-1) + 1))]
+
+    diff = np.zeros((n_minutes + 1) * n_edges, dtype=np.int64 if prob is None else float)
+    for start in range(0, len(valid), chunksize):
+        trip = valid[start:start + chunksize]
+        # 每条出行展开为其 OD 的每条路径，去掉耗时为 0 的路径
+        row = od_row[trip]
+        m = np.diff(path_start)[row]
+        trip = np.repeat(trip, m)
+        path = np.repeat(path_start[row], m) + np.arange(m.sum()) - np.repeat(np.cumsum(m) - m, m)
+        keep = total[path] > 0
+        trip, path = trip[keep], path[keep]
+        # 每条路径展开为其经过的每条边
+        n = np.diff(edge_offsets)[path]
+        trip_index = np.repeat(np.arange(len(trip)), n)
+        position = np.repeat(edge_offsets[path], n) + np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+        scale = ((dseconds[trip] - oseconds[trip]) / total[path])[trip_index]
+        enter = oseconds[trip][trip_index] + before[position] * scale
+        leave = enter + duration[position] * scale
+        first = np.clip(enter // 60, 0, n_minutes - 1).astype(np.int64)
+        last = np.clip(leave // 60, 0, n_minutes - 1).astype(np.int64) + 1
+        edge = edges[position]
+        weight = None if prob is None else prob[path][trip_index]
+        diff += np.bincount(first * n_edges + edge, weights=weight, minlength=len(diff))
+        diff -= np.bincount(last * n_edges + edge, weights=weight, minlength=len(diff))
+    load = np.cumsum(diff.reshape(n_minutes + 1, n_edges), axis=0)[:n_minutes]
+    return load.astype(np.int32 if prob is None else np.float32)
+
+
+# 多路径 Logit 分配：path_od、path_cost、offsets、nodes 为 k_shortest_paths 返回的路径，n_od 为 OD 数
+# 各 OD 的需求按 exp(-theta × 路径费用) 的比例分到各条路径；path_size 为 True 时使用路径规模修正（Path-Size Logit），
+# 重叠的路径按各边被同一 OD 的路径共用的次数降低权重，避免几乎相同的路径分走过多客流
+# 返回 (OD × 边 的稀疏关联矩阵, 各路径的选择概率)，关联矩阵元素为 OD 经过该边的概率，可直接代替单一路径的关联矩阵
+def logit_incidence(graph, path_od, path_cost, offsets, nodes, n_od, theta=LOGIT_THETA, path_size=True):
+    paths = path_incidence(graph, offsets, nodes)
+    n_paths = len(path_od)
+    group = csr_matrix((np.ones(n_paths), (path_od, np.arange(n_paths))), shape=(n_od, n_paths))
+    min_cost = np.full(n_od, np.inf)
+    np.minimum.at(min_cost, path_od, path_cost)
+    utility = -theta * (path_cost - min_cost[path_od])
+    if path_size:
+        # 路径上各边被同一 OD 的几条路径共用，路径规模 = Σ(边耗时 / 路径耗时 / 共用路径数)
+        shared = paths.multiply(group.T @ (group @ paths)).tocsr()
+        shared.data = 1 / shared.data
+        length = paths @ graph.duration
+        size = np.ones(n_paths)
+        np.divide(shared @ graph.duration, length, out=size, where=length > 0)
+        utility += np.log(size)
+    weight = np.exp(utility)
+    prob = weight / np.bincount(path_od, weights=weight, minlength=n_od)[path_od]
+    incidence = csr_matrix((prob, (path_od, np.arange(n_paths))), shape=(n_od, n_paths)) @ paths
+    return incidence.tocsr(), prob
@@ -0,0 +1,118 @@
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix, diags, hstack
+from scipy.sparse.linalg import lsqr
+
+from 轨道网络 import od_shortest_paths, path_incidence
+
+# 标定后的边表保存路径（格式与 load_metro_graph 的 edge_path 相同）
+CALIBRATED_EDGE_PATH = r'data/edge_calibrated.csv'
+# 进出站耗时（分钟）的先验值：刷卡进站到上车、下车到刷卡出站的步行与候车时间
+ACCESS_DURATION = 5
+# 参与标定的出行耗时范围（分钟），范围外的出行视为异常
+MIN_JOURNEY = 2
+MAX_JOURNEY = 180
+# 轨道段耗时下限（分钟）
+MIN_DURATION = 0.5
+# 正则化系数：轨道段耗时向先验值收缩，没有出行经过的轨道段保持先验值
+DAMP = 0.1
+# 分时段标定的时段划分（小时）
+TIME_BANDS = [0, 7, 9, 17, 19, 24]
+
+
+# 一组出行的耗时标定：出行耗时 = 进出站耗时 + 路径上各轨道段耗时之和，
+# 出行按 OD 汇总为 OD 平均耗时，以出行次数的平方根为权重，与逐条出行的最小二乘等价，矩阵行数只与 OD 数有关
+# design 为 OD × (轨道段 + 1) 的稀疏设计矩阵（最后一列为进出站耗时），prior 为先验值，
+# row 为每条出行的 OD 行号，minutes 为出行耗时；用 lsqr 求解相对先验值的修正量，返回 (估计值, 各 OD 出行次数)
+def _solve(design, prior, row, minutes, damp=DAMP):
+    n = np.bincount(row, minlength=design.shape[0])
+    total = np.bincount(row, weights=minutes, minlength=design.shape[0])
+    observed = np.flatnonzero(n > 0)
+    if len(observed) == 0:
+        return prior.copy(), n
+    w = np.sqrt(n[observed])
+    a = diags(w) @ design[observed]
+    b = w * (total[observed] / n[observed] - design[observed] @ prior)
+    delta = lsqr(a, b, damp=damp)[0]
+    return prior + delta, n
+
+
+# 由出行记录标定轨道段耗时与换乘耗时
+# o、d 为每条出行的起终点站点编号（-1 为未匹配），oseconds、dseconds 为进站、出站时刻距当天 0 点的秒数
+# 路径为当前耗时下的最短路径：先以网络原有耗时求路径并标定，再以标定结果重新求路径，共 iterations 轮；
+# 每条轨道段（含换乘边）两个方向共用一个耗时，bands 给定时再按进站时刻分时段各标定一次（路径沿用全天结果）
+# 返回 dict：duration 为全天各有向边耗时，access 为进出站耗时，trips 为各有向边经过的出行数，
+# bands 给定时另有 band_duration（时段 × 有向边）、band_access、band_trips（各时段参与标定的出行数）
+def calibrate_durations(graph, o, d, oseconds, dseconds, bands=None, iterations=2, processes=1,
+                        access_duration=ACCESS_DURATION, damp=DAMP, min_journey=MIN_JOURNEY,
+                        max_journey=MAX_JOURNEY, min_duration=MIN_DURATION):
+    o, d = np.asarray(o, dtype=np.int64), np.asarray(d, dtype=np.int64)
+    oseconds, dseconds = np.asarray(oseconds, dtype=float), np.asarray(dseconds, dtype=float)
+    minutes = (dseconds - oseconds) / 60
+    valid = (o >= 0) & (d >= 0) & (o != d) & (minutes >= min_journey) & (minutes <= max_journey)
+    o, d, oseconds, minutes = o[valid], d[valid], oseconds[valid], minutes[valid]
+
+    # 去重 OD，trip_od 为每条出行的 OD 序号
+    od_key, trip_od = np.unique(o * len(graph) + d, return_inverse=True)
+    od_o, od_d = od_key // len(graph), od_key % len(graph)
+
+    arc_segment, n_segments = graph.segments()
+    segment_prior = np.zeros(n_segments)
+    np.maximum.at(segment_prior, arc_segment, graph.duration)
+    prior = np.r_[segment_prior, access_duration]
+
+    estimate = prior
+    for _ in range(iterations):
+        # 当前耗时下的最短路径，有向边列合并为轨道段列，再加上进出站耗时列
+        current = graph.with_durations(np.maximum(estimate[:-1], min_duration)[arc_segment])
+        cost, offsets, nodes = od_shortest_paths(current, od_o, od_d, processes=processes)
+        incidence = path_incidence(current, offsets, nodes)
+        design = csr_matrix((incidence.data, arc_segment[incidence.indices], incidence.indptr),
+                            shape=(len(od_key), n_segments))
+        design = hstack([design, np.ones((len(od_key), 1))], format='csr')
+        # 不连通 OD 的出行不参与标定
+        keep = np.isfinite(cost)[trip_od]
+        estimate, n = _solve(design, prior, trip_od[keep], minutes[keep], damp)
+
+    duration = np.maximum(estimate[:-1], min_duration)[arc_segment]
+    result = {
+        'duration': duration,
+        'access': float(estimate[-1]),
+        'trips': np.rint(incidence.T @ n.astype(float)).astype(np.int64),
+    }
+
+    if bands is not None:
+        band = np.searchsorted(bands, oseconds[keep] / 3600, side='right') - 1
+        band_estimate = []
+        band_trips = []
+        for k in range(len(bands) - 1):
+            inband = band == k
+            band_estimate.append(_solve(design, estimate, trip_od[keep][inband], minutes[keep][inband], damp)[0])
+            band_trips.append(int(inband.sum()))
+        band_estimate = np.array(band_estimate).reshape(-1, len(prior))
+        result['bands'] = np.asarray(bands)
+        result['band_duration'] = np.maximum(band_estimate[:, :-1], min_duration)[:, arc_segment]
+        result['band_access'] = band_estimate[:, -1]
+        result['band_trips'] = np.array(band_trips)
+    return result
+
+
+# 标定结果写回网络，并保存为边表（ostation, dstation, duration），之后可由 load_metro_graph(edge_path=...) 直接读取
+def save_calibrated_edges(graph, duration, path=CALIBRATED_EDGE_PATH):
+    calibrated = graph.with_durations(duration)
+    calibrated.edges().to_csv(path, index=None, encoding='utf-8-sig')
+    return calibrated
+
+
+# 分时段标定结果汇总表：每个时段、每条有向边一行
+def band_table(graph, result):
+    bands = result['bands']
+    n_bands, n_edges = result['band_duration'].shape
+    return pd.DataFrame({
+        'start_hour': np.repeat(bands[:-1], n_edges),
+        'end_hour': np.repeat(bands[1:], n_edges),
+        'ostation': np.tile(graph.stations[graph.edge_o], n_bands),
+        'dstation': np.tile(graph.stations[graph.edge_d], n_bands),
+        'duration': result['band_duration'].ravel(),
+        'access': np.repeat(result['band_access'], n_edges),
+    })
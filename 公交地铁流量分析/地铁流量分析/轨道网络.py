@@ -0,0 +1,412 @@
+import hashlib
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# 轨道站点数据与编译后网络的缓存目录
+STOP_PATH = r'data/stop.csv'
+CACHE_DIR = r'data/cache'
+# 搭乘一个站点耗时与换乘耗时（分钟）
+RIDE_DURATION = 3
+TRANSFER_DURATION = 5
+# 最短路计算时每个任务包含的起点数
+ORIGIN_BATCH = 32
+# 多路径生成：每个 OD 的路径数、相对最短路的最大绕行比例、每次换乘的附加费用（分钟）、每个任务包含的 OD 数
+K_PATHS = 3
+MAX_DETOUR = 0.3
+TRANSFER_PENALTY = 5
+OD_CHUNK = 4096
+# 缓存格式版本，构建逻辑变化时修改，使旧缓存失效
+CACHE_VERSION = 1
+
+
+# 没有 if __name__ == '__main__' 保护的脚本使用的进程数：只有以 fork 方式创建的子进程不会重新执行脚本，
+# 此时使用全部 CPU；spawn、forkserver（Windows、macOS 以及 Python 3.14 起 Linux 的默认方式）下单进程计算
+def script_processes():
+    return (os.cpu_count() or 1) if multiprocessing.get_start_method() == 'fork' else 1
+
+
+# 由线路名称提取线路（去除括号和"地铁"前缀），五号线支线统一为"5号线"
+def line_of(linename):
+    line = linename.str.split('(').str[0].str.lstrip('地铁')
+    return line.where(line != '5号线支线', '5号线')
+
+
+# 由站点表构建网络边：同一线路相邻站为轨道边，不同线路同名站之间为换乘边
+# 站点名称为 线路名+站点名，以区分不同线路的同名站
+def build_edges(stop, ride_duration=RIDE_DURATION, transfer_duration=TRANSFER_DURATION):
+    stop = stop.copy()
+    stop['linename1'] = stop['linename'].shift(-1)
+    stop['stationnames1'] = stop['stationnames'].shift(-1)
+    stop = stop[stop['linename'] == stop['linename1']].copy()
+    stop['line'] = line_of(stop['linename'])
+    stop['ostation'] = stop['line'] + stop['stationnames']
+    stop['dstation'] = stop['line'] + stop['stationnames1']
+    edge1 = stop[['ostation', 'dstation']].assign(duration=ride_duration)
+
+    # 换乘边：同一站点名出现在多条线路上
+    tmp = stop[['stationnames', 'line', 'ostation']].drop_duplicates()
+    tmp = tmp[tmp.groupby('stationnames')['line'].transform('nunique') > 1]
+    tmp = pd.merge(tmp, tmp, on='stationnames')
+    edge2 = tmp[tmp['line_x'] != tmp['line_y']][['ostation_x', 'ostation_y']]
+    edge2.columns = ['ostation', 'dstation']
+    edge2 = edge2.assign(duration=transfer_duration)
+    return pd.concat([edge1, edge2], ignore_index=True)
+
+
+# 整数编号的轨道网络：站点编号为 0..n-1，网络为无向图，
+# 每条边拆成两个方向的有向边，有向边按 (起点, 终点) 排序后的序号即为边编号，
+# 与 CSR 邻接矩阵 adjacency 的 data 数组一一对应（adjacency.data[k] 为边 k 的耗时）
+class MetroGraph:
+    def __init__(self, stations, edge_o, edge_d, duration):
+        self.stations = np.asarray(stations, dtype=str)
+        self.station_index = pd.Index(self.stations)
+        self.edge_o = np.asarray(edge_o, dtype=np.int32)
+        self.edge_d = np.asarray(edge_d, dtype=np.int32)
+        self.duration = np.asarray(duration, dtype=float)
+        n = len(self.stations)
+        indptr = np.r_[0, np.cumsum(np.bincount(self.edge_o, minlength=n))]
+        self.adjacency = csr_matrix((self.duration, self.edge_d, indptr), shape=(n, n))
+
+    # 由边表构建：站点名称映射为整数编号，补全反向边，重复边保留耗时最小的一条
+    @classmethod
+    def from_edges(cls, edge):
+        stations = np.unique(np.r_[edge['ostation'].to_numpy(dtype=str), edge['dstation'].to_numpy(dtype=str)])
+        o = np.searchsorted(stations, edge['ostation'].to_numpy(dtype=str))
+        d = np.searchsorted(stations, edge['dstation'].to_numpy(dtype=str))
+        arcs = pd.DataFrame({'o': np.r_[o, d], 'd': np.r_[d, o],
+                             'duration': np.r_[edge['duration'], edge['duration']].astype(float)})
+        arcs = arcs[arcs['o'] != arcs['d']]
+        arcs = arcs.groupby(['o', 'd'], sort=True)['duration'].min().reset_index()
+        return cls(stations, arcs['o'], arcs['d'], arcs['duration'])
+
+    def __len__(self):
+        return len(self.stations)
+
+    # 站点名称转换为编号，网络中不存在的站点为 -1
+    def index(self, names):
+        return self.station_index.get_indexer(names)
+
+    # 有向边 (o, d) 的边编号，不存在的边为 -1
+    def edge_id(self, o, d):
+        o, d = np.asarray(o), np.asarray(d)
+        start, end = self.adjacency.indptr[o], self.adjacency.indptr[o + 1]
+        # 边按 (起点, 终点) 排序，起点、终点拼成一个有序的键后一次查找
+        key = self.edge_o.astype(np.int64) * len(self) + self.edge_d
+        k = np.searchsorted(key, o.astype(np.int64) * len(self) + d)
+        found = (k >= start) & (k < end)
+        found[found] = self.edge_d[k[found]] == d[found]
+        return np.where(found, k, -1)
+
+    # 换乘边：起终点站点的线路（站点名称中第一个"线"字及之前的部分）不同的有向边
+    def transfer_arcs(self):
+        line = pd.Series(self.stations).str.extract(r'^([^线]*线)')[0].fillna('').to_numpy()
+        return line[self.edge_o] != line[self.edge_d]
+
+    # 替换边耗时后的新网络（站点与边编号不变），用于写回标定后的耗时
+    def with_durations(self, duration):
+        return type(self)(self.stations, self.edge_o, self.edge_d, duration)
+
+    # 无向轨道段编号：同一对站点之间两个方向的有向边属于同一轨道段，返回 (各有向边的轨道段编号, 轨道段数)
+    def segments(self):
+        lo = np.minimum(self.edge_o, self.edge_d).astype(np.int64)
+        hi = np.maximum(self.edge_o, self.edge_d)
+        key, segment = np.unique(lo * len(self) + hi, return_inverse=True)
+        return segment.astype(np.int32), len(key)
+
+    # 边表（站点名称形式）
+    def edges(self):
+        return pd.DataFrame({'ostation': self.stations[self.edge_o], 'dstation': self.stations[self.edge_d],
+                             'duration': self.duration})
+
+    # 转换为 networkx 无向图，用于绘图等
+    def to_networkx(self):
+        import networkx as nx
+        G = nx.Graph()
+        G.add_nodes_from(self.stations)
+        G.add_weighted_edges_from(zip(self.stations[self.edge_o], self.stations[self.edge_d], self.duration),
+                                  weight='duration')
+        return G
+
+    def save(self, path):
+        np.savez(path, stations=self.stations, edge_o=self.edge_o, edge_d=self.edge_d, duration=self.duration)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['stations'], data['edge_o'], data['edge_d'], data['duration'])
+
+
+# 输入文件内容与构建参数的哈希值，作为缓存的键
+def _input_hash(paths, *params):
+    h = hashlib.sha1(repr((CACHE_VERSION,) + params).encode('utf-8'))
+    for path in paths:
+        with open(path, 'rb') as f:
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+# 读取轨道网络：输入文件未变化时直接读取缓存，否则重新构建并写入缓存
+# 默认由站点表 stop_path 构建；给定 edge_path 时直接使用已有的边表（ostation, dstation, duration）
+def load_metro_graph(stop_path=STOP_PATH, edge_path=None, cache_dir=CACHE_DIR,
+                     ride_duration=RIDE_DURATION, transfer_duration=TRANSFER_DURATION):
+    source = edge_path if edge_path is not None else stop_path
+    key = _input_hash([source], edge_path is not None, ride_duration, transfer_duration)
+    cache_path = os.path.join(cache_dir, f'metro_graph_{key}.npz')
+    if os.path.exists(cache_path):
+        return MetroGraph.load(cache_path)
+
+    if edge_path is not None:
+        edge = pd.read_csv(edge_path)
+    else:
+        edge = build_edges(pd.read_csv(stop_path), ride_duration, transfer_duration)
+    graph = MetroGraph.from_edges(edge)
+    os.makedirs(cache_dir, exist_ok=True)
+    graph.save(cache_path)
+    return graph
+
+
+# 每个进程初始化时保存一次邻接矩阵，之后各批起点复用
+_adjacency = None
+
+
+def _init_worker(adjacency):
+    global _adjacency
+    _adjacency = adjacency
+
+
+# 一批起点的单源最短路：返回到所有站点的耗时与前驱节点
+def _dijkstra_batch(origins):
+    dist, pred = dijkstra(_adjacency, directed=True, indices=origins, return_predecessors=True)
+    return dist, pred.astype(np.int32)
+
+
+# OD 最短路径：按起点分组，每个不同的起点只做一次单源 Dijkstra（scipy.sparse.csgraph），
+# 各终点的路径由前驱数组回溯得到，所有 OD 同时回溯，循环次数只与最长路径的站点数有关
+# o、d 为站点编号数组；processes 大于 1 时各批起点分配到进程池计算
+# 返回 (耗时, 路径偏移, 路径站点)：第 i 个 OD 的路径为 nodes[offsets[i]:offsets[i+1]]，不连通的 OD 耗时为 inf、路径为空
+def od_shortest_paths(graph, o, d, processes=1, origin_batch=ORIGIN_BATCH):
+    o, d = np.asarray(o), np.asarray(d)
+    origins, row = np.unique(o, return_inverse=True)
+    batches = [origins[i:i + origin_batch] for i in range(0, len(origins), origin_batch)]
+    if processes == 1:
+        _init_worker(graph.adjacency)
+        results = [_dijkstra_batch(batch) for batch in batches]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(graph.adjacency,)) as executor:
+            results = list(executor.map(_dijkstra_batch, batches))
+    if results:
+        dist = np.vstack([r[0] for r in results])
+        pred = np.vstack([r[1] for r in results])
+    else:
+        dist = np.zeros((0, len(graph)))
+        pred = np.zeros((0, len(graph)), dtype=np.int32)
+
+    cost = dist[row, d]
+    offsets, nodes = _backtrack(pred, row, o, d, np.isfinite(cost))
+    return cost, offsets, nodes
+
+
+# 由前驱数组回溯路径：pred[row[i]] 为以 o[i] 为起点的前驱数组，所有 OD 同时回溯，循环次数只与最长路径的站点数有关
+# 返回 (路径偏移, 路径站点)，reachable 为 False 的 OD 路径为空
+def _backtrack(pred, row, o, d, reachable):
+    # 从终点沿前驱数组同时回溯所有 OD，steps[k] 为各 OD 路径上倒数第 k+1 个站点
+    current = np.where(reachable, d, -1)
+    steps = [current.copy()]
+    active = reachable & (current != o)
+    while active.any():
+        current[active] = pred[row[active], current[active]]
+        steps.append(current.copy())
+        active &= current != o
+    steps = np.vstack(steps)
+
+    # 路径站点数，压缩成连续数组，并按起点到终点的顺序排列
+    length = np.where(reachable, np.argmax(steps == o, axis=0) + 1, 0)
+    offsets = np.r_[0, np.cumsum(length)]
+    k, i = np.nonzero(np.arange(steps.shape[0])[:, None] < length[None, :])
+    nodes = np.empty(offsets[-1], dtype=np.int32)
+    nodes[offsets[i] + length[i] - 1 - k] = steps[k, i]
+    return offsets, nodes
+
+
+# 按编号取出部分路径：idx 为路径序号，返回新的 (路径偏移, 路径站点)
+def _take_paths(offsets, nodes, idx):
+    length = np.diff(offsets)[idx]
+    new_offsets = np.r_[0, np.cumsum(length)]
+    position = np.repeat(offsets[idx] - new_offsets[:-1], length) + np.arange(new_offsets[-1])
+    return new_offsets, nodes[position]
+
+
+# 每个进程初始化时保存一次全网最短路费用与前驱矩阵，之后各批 OD 复用
+_dist = None
+_pred = None
+
+
+def _init_path_worker(dist, pred):
+    global _dist, _pred
+    _dist, _pred = dist, pred
+
+
+# 一批 OD 的经由站点路径：经由站点 v 的路径为 o→v 与 v→d 两段最短路相连，费用为 dist[o, v] + dist[v, d]
+# 每轮为每个 OD 选出费用最小、且不在已选路径上的经由站点，新路径必然经过一个已选路径之外的站点，因此与已选路径都不同；
+# 两段相交（含重复站点）的路径舍弃，只排除该经由站点；费用超过最短路 (1 + max_detour) 倍的经由站点不参与
+# 返回 (各路径的 OD 序号, 费用, 路径偏移, 路径站点)，同一 OD 的路径按费用从小到大排列
+def _via_paths(task):
+    o, d, k, max_detour = task
+    m, n = len(o), _dist.shape[0]
+    via_cost = _dist[o] + _dist[:, d].T
+    via_cost[~(via_cost <= (_dist[o, d] * (1 + max_detour))[:, None] + 1e-9)] = np.inf
+    found = np.zeros(m, dtype=int)
+    result_od, result_cost, result_offsets, result_nodes = [], [], [], []
+    for _ in range(2 * k + 2):
+        row = np.flatnonzero(found < k)
+        v = np.argmin(via_cost[row], axis=1)
+        cost = via_cost[row, v]
+        keep = np.isfinite(cost)
+        row, v, cost = row[keep], v[keep], cost[keep]
+        if len(row) == 0:
+            break
+        # 两段路径分别回溯后拼接，第二段去掉与第一段重复的经由站点
+        first_offsets, first_nodes = _backtrack(_pred, o[row], o[row], v, np.ones(len(row), dtype=bool))
+        second_offsets, second_nodes = _backtrack(_pred, v, v, d[row], np.ones(len(row), dtype=bool))
+        first_length, second_length = np.diff(first_offsets), np.diff(second_offsets)
+        offsets = np.r_[0, np.cumsum(first_length + second_length - 1)]
+        nodes = np.empty(offsets[-1], dtype=np.int32)
+        path = np.repeat(np.arange(len(row)), first_length)
+        nodes[offsets[path] + np.arange(len(first_nodes)) - first_offsets[path]] = first_nodes
+        path = np.repeat(np.arange(len(row)), second_length)
+        local = np.arange(len(second_nodes)) - second_offsets[path]
+        second = local > 0
+        nodes[(offsets[path] + first_length[path] - 1 + local)[second]] = second_nodes[second]
+
+        # 含重复站点的路径
+        path = np.repeat(np.arange(len(row)), np.diff(offsets))
+        key, count = np.unique(path.astype(np.int64) * n + nodes, return_counts=True)
+        simple = np.ones(len(row), dtype=bool)
+        simple[key[count > 1] // n] = False
+
+        # 已选路径上的站点不再作为经由站点，舍弃的路径只排除其经由站点
+        via_cost[row, v] = np.inf
+        valid = simple[path]
+        via_cost[row[path[valid]], nodes[valid]] = np.inf
+        found[row[simple]] += 1
+        result_od.append(row[simple])
+        result_cost.append(cost[simple])
+        offsets, nodes = _take_paths(offsets, nodes, np.flatnonzero(simple))
+        result_offsets.append(offsets)
+        result_nodes.append(nodes)
+
+    if not result_od:
+        return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32)
+    path_od = np.concatenate(result_od)
+    cost = np.concatenate(result_cost)
+    lengths = np.concatenate([np.diff(x) for x in result_offsets])
+    offsets = np.r_[0, np.cumsum(lengths)]
+    nodes = np.concatenate(result_nodes)
+    order = np.lexsort((cost, path_od))
+    offsets, nodes = _take_paths(offsets, nodes, order)
+    return path_od[order], cost[order], offsets, nodes
+
+
+# OD 多路径：以 耗时 + 每次换乘 transfer_penalty 分钟 为路径费用，为每个 OD 生成至多 k 条费用不超过最短路
+# (1 + max_detour) 倍的经由站点路径（第一条为最短路）；全网最短路费用与前驱矩阵只计算一次，
+# OD 按起点排序后分批，processes 大于 1 时各批分配到进程池计算
+# 生成的路径按 OD 缓存在 cache_dir 中（以网络、费用参数区分），之后只计算缓存中没有的 OD
+# 返回 (各路径的 OD 序号, 路径费用, 路径偏移, 路径站点)：第 j 条路径属于第 path_od[j] 个 OD，
+# 站点为 nodes[offsets[j]:offsets[j+1]]；不连通的 OD 没有路径
+def k_shortest_paths(graph, o, d, k=K_PATHS, max_detour=MAX_DETOUR, transfer_penalty=TRANSFER_PENALTY,
+                     processes=1, cache_dir=CACHE_DIR, od_chunk=OD_CHUNK):
+    n = len(graph)
+    key = np.asarray(o, dtype=np.int64) * n + np.asarray(d, dtype=np.int64)
+    cost_graph = graph.with_durations(graph.duration + transfer_penalty * graph.transfer_arcs())
+    h = hashlib.sha1(repr((CACHE_VERSION, k, max_detour, transfer_penalty)).encode('utf-8'))
+    for array in (cost_graph.stations, cost_graph.edge_o, cost_graph.edge_d, cost_graph.duration):
+        h.update(np.ascontiguousarray(array).tobytes())
+    cache_path = os.path.join(cache_dir, f'od_paths_{h.hexdigest()[:16]}.npz') if cache_dir else None
+
+    # 缓存：已计算的 OD 键，各路径的 OD 键、费用、路径偏移与站点，路径按 (OD 键, 费用) 排序
+    if cache_path is not None and os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            cached = {name: data[name] for name in data.files}
+    else:
+        cached = {'od_key': np.zeros(0, dtype=np.int64), 'path_key': np.zeros(0, dtype=np.int64),
+                  'cost': np.zeros(0), 'offsets': np.zeros(1, dtype=np.int64), 'nodes': np.zeros(0, dtype=np.int32)}
+
+    missing = np.setdiff1d(key, cached['od_key'])
+    if len(missing):
+        dist, pred = dijkstra(cost_graph.adjacency, directed=True, return_predecessors=True)
+        pred = pred.astype(np.int32)
+        tasks = [(missing[i:i + od_chunk] // n, missing[i:i + od_chunk] % n, k, max_detour)
+                 for i in range(0, len(missing), od_chunk)]
+        if processes == 1:
+            _init_path_worker(dist, pred)
+            results = [_via_paths(task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=processes, initializer=_init_path_worker,
+                                     initargs=(dist, pred)) as executor:
+                results = list(executor.map(_via_paths, tasks))
+        start = np.arange(0, len(missing), od_chunk)
+        path_key = np.concatenate([cached['path_key']] + [missing[s + r[0]] for s, r in zip(start, results)])
+        cost = np.concatenate([cached['cost']] + [r[1] for r in results])
+        lengths = np.concatenate([np.diff(cached['offsets'])] + [np.diff(r[2]) for r in results])
+        nodes = np.concatenate([cached['nodes']] + [r[3] for r in results])
+        order = np.lexsort((cost, path_key))
+        offsets, nodes = _take_paths(np.r_[0, np.cumsum(lengths)], nodes, order)
+        cached = {'od_key': np.union1d(cached['od_key'], missing), 'path_key': path_key[order],
+                  'cost': cost[order], 'offsets': offsets, 'nodes': nodes}
+        if cache_path is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.savez(cache_path, **cached)
+
+    # 取出所需 OD 的路径
+    start = np.searchsorted(cached['path_key'], key, side='left')
+    count = np.searchsorted(cached['path_key'], key, side='right') - start
+    path_od = np.repeat(np.arange(len(key)), count)
+    idx = np.repeat(start - np.r_[0, np.cumsum(count)[:-1]], count) + np.arange(count.sum())
+    offsets, nodes = _take_paths(cached['offsets'], cached['nodes'], idx)
+    return path_od, cached['cost'][idx], offsets, nodes
+
+
+# 路径经过的有向边：offsets、nodes 为 od_shortest_paths 返回的路径，路径上相邻两个站点构成一条有向边
+# 返回 (边偏移, 边编号)：第 i 个 OD 依次经过的边为 edges[edge_offsets[i]:edge_offsets[i+1]]
+def path_edges(graph, offsets, nodes):
+    n_od = len(offsets) - 1
+    row = np.repeat(np.arange(n_od), np.diff(offsets))
+    # 同一路径内的相邻站点对
+    pair = np.flatnonzero(row[1:] == row[:-1])
+    edges = graph.edge_id(nodes[pair], nodes[pair + 1])
+    edge_offsets = np.r_[0, np.cumsum(np.bincount(row[pair], minlength=n_od))]
+    return edge_offsets, edges
+
+
+# OD × 边 的稀疏关联矩阵：第 i 行为第 i 个 OD 的路径经过的有向边（值为 1）
+def path_incidence(graph, offsets, nodes):
+    edge_offsets, edges = path_edges(graph, offsets, nodes)
+    return csr_matrix((np.ones(len(edges), dtype=np.float32), edges, edge_offsets),
+                      shape=(len(offsets) - 1, len(graph.duration)))
+
+
+# 断面客流：OD 需求向量与关联矩阵相乘，得到每条有向边的客流量
+def section_flows(incidence, demand):
+    return incidence.T @ np.asarray(demand, dtype=float)
+
+
+# 保存、读取 OD 路径关联矩阵及各行对应的起终点站点编号
+# 多路径分配的关联矩阵元素为各 OD 经过该边的概率，同时保存元素值；单一路径的关联矩阵元素均为 1
+def save_od_paths(path, incidence, o, d):
+    np.savez_compressed(path, indptr=incidence.indptr, indices=incidence.indices, data=incidence.data,
+                        shape=incidence.shape, o=np.asarray(o, dtype=np.int32), d=np.asarray(d, dtype=np.int32))
+
+
+def load_od_paths(path):
+    with np.load(path) as data:
+        indices = data['indices']
+        values = data['data'] if 'data' in data.files else np.ones(len(indices), dtype=np.float32)
+        incidence = csr_matrix((values, indices, data['indptr']), shape=tuple(data['shape']))
+        return incidence, data['o'], data['d']
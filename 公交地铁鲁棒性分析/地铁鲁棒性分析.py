@@ -0,0 +1,79 @@
+import os
+import sys
+
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from 网络鲁棒性 import (REPLICATES, STOP_PATH, attack_order, curve_table, od_demand, random_attack, read_network,
+                   robustness_index, simulate)
+
+# 进程数的判断与 公交地铁流量分析/地铁流量分析 的脚本共用 轨道网络.script_processes
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '公交地铁流量分析', '地铁流量分析'))
+from 轨道网络 import script_processes
+
+# 随机攻击的进程数：本脚本没有 if __name__ == '__main__' 保护，只在以 fork 方式创建子进程时使用进程池
+PROCESSES = script_processes()
+# 地铁出行记录（可选，用于客流攻击与 OD 可达性）：可将 公交地铁流量分析/地铁流量分析/data/metrood.csv 复制到此处，
+# 使用其中的 ostop、dstop 两列
+OD_PATH = r'地铁数据/metrood.csv'
+
+# 设置 Matplotlib 显示中文和负号
+plt.rcParams['font.sans-serif'] = ['SimHei']
+plt.rcParams['font.serif'] = ['SimHei']
+plt.rcParams['axes.unicode_minus'] = False
+
+os.makedirs('结果', exist_ok=True)
+os.makedirs('图片', exist_ok=True)
+
+# 读取地铁网络：同名站点（换乘站）合并为一个站点，同一线路相邻站点之间连边
+network = read_network(STOP_PATH)
+print(f"地铁网络：{len(network)} 个站点，{network.n_edges} 条边")
+
+# 读取 OD 需求
+demand = None
+if os.path.exists(OD_PATH):
+    od = pd.read_csv(OD_PATH, usecols=['ostop', 'dstop'])
+    demand, dropped = od_demand(network, od['ostop'].str.strip(), od['dstop'].str.strip())
+    print(f"读取 {len(od)} 条地铁出行，其中 {dropped} 条的站点不在网络中")
+else:
+    print(f"未找到 '{OD_PATH}'，跳过客流攻击与 OD 可达性")
+
+strategies = ['degree', 'betweenness'] + (['flow'] if demand is not None else [])
+betweenness = network.betweenness()
+
+for target, label in [('node', '站点'), ('edge', '区间')]:
+    print(f"--- {label}攻击 ---")
+    curves = {}
+    # 蓄意攻击：按得分从高到低依次移除
+    for strategy in strategies:
+        order = attack_order(network, strategy, target, rng=0, demand=demand, betweenness=betweenness)
+        curves[strategy] = simulate(network, order, target, demand)
+    # 随机攻击：多次重复取平均
+    curves['random'] = random_attack(network, REPLICATES, target, demand, processes=PROCESSES)
+
+    for strategy, result in curves.items():
+        print(f"{strategy}：鲁棒性指标 R = {robustness_index(result):.3f}")
+
+    table = curve_table(curves)
+    table.to_csv(f'结果/{label}攻击鲁棒性曲线.csv', index=None, encoding='utf-8-sig')
+    print(f"指标曲线已保存到 '结果/{label}攻击鲁棒性曲线.csv'")
+
+    # 最大连通子图比例与全局效率随移除比例的变化
+    metrics = [('lcc', '最大连通子图比例'), ('efficiency', '全局效率')]
+    if demand is not None:
+        metrics.append(('od_reachability', 'OD 可达比例'))
+    fig, axes = plt.subplots(1, len(metrics), figsize=(5 * len(metrics), 4), dpi=250)
+    for ax, (metric, name) in zip(axes, metrics):
+        for strategy, curve in table.groupby('strategy', sort=False):
+            ax.plot(curve['removed'], curve[metric], label=strategy)
+            if strategy == 'random':
+                ax.fill_between(curve['removed'], curve[metric] - curve[metric + '_std'],
+                                curve[metric] + curve[metric + '_std'], alpha=0.3)
+        ax.set_xlabel(f'移除{label}比例')
+        ax.set_ylabel(name)
+        ax.legend()
+    plt.suptitle(f'地铁网络{label}攻击鲁棒性')
+    plt.tight_layout()
+    plt.savefig(f'图片/{label}攻击鲁棒性.svg', format='svg')
+    plt.close(fig)
+    print(f"鲁棒性曲线图已保存到 '图片/{label}攻击鲁棒性.svg'")
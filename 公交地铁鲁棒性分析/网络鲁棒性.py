@@ -0,0 +1,281 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# 地铁站点数据（地铁数据获取.py 生成）
+STOP_PATH = r'地铁数据/stop.json'
+# 环线：首末站相连
+LOOP_LINES = ('地铁4号线',)
+# 攻击策略：随机、度、介数、客流
+STRATEGIES = ('random', 'degree', 'betweenness', 'flow')
+# 随机攻击的重复次数与随机种子
+REPLICATES = 100
+SEED = 0
+
+
+# 数组形式的网络：站点编号为 0..n-1，同名站点（换乘站）合并为一个站点，边为无向边，
+# 第 k 条边连接 edge_u[k] 与 edge_v[k]；adjacency 为对称的 CSR 邻接矩阵，值为边编号 + 1
+class Network:
+    def __init__(self, names, edge_u, edge_v):
+        self.names = np.asarray(names, dtype=str)
+        self.edge_u = np.asarray(edge_u, dtype=np.int32)
+        self.edge_v = np.asarray(edge_v, dtype=np.int32)
+        n, m = len(self.names), len(self.edge_u)
+        self.adjacency = csr_matrix((np.r_[np.arange(m), np.arange(m)] + 1,
+                                     (np.r_[self.edge_u, self.edge_v], np.r_[self.edge_v, self.edge_u])),
+                                    shape=(n, n))
+
+    # 由站点表构建：同一线路按站序相邻的站点之间连边，环线首末站相连，重复边只保留一条
+    @classmethod
+    def from_stops(cls, stop, loop_lines=LOOP_LINES):
+        stop = stop[stop['direction'] == 1].sort_values(by=['x', 'linename', 'num'])
+        names = np.unique(stop['name'].to_numpy(dtype=str))
+        node = np.searchsorted(names, stop['name'].to_numpy(dtype=str))
+        line = stop['linename'].to_numpy(dtype=str)
+        same = line[1:] == line[:-1]
+        u, v = node[:-1][same], node[1:][same]
+        # 环线：每条环线最后一站与第一站相连
+        first = np.r_[True, ~same]
+        last = np.r_[~same, True]
+        loop = pd.Series(line).str.startswith(tuple(loop_lines)).to_numpy()
+        u = np.r_[u, node[last & loop]]
+        v = np.r_[v, node[first & loop]]
+        key = np.unique(np.minimum(u, v).astype(np.int64) * len(names) + np.maximum(u, v))
+        key = key[key // len(names) != key % len(names)]
+        return cls(names, key // len(names), key % len(names))
+
+    def __len__(self):
+        return len(self.names)
+
+    @property
+    def n_edges(self):
+        return len(self.edge_u)
+
+    def degree(self):
+        return np.diff(self.adjacency.indptr)
+
+    # 站点名称转换为编号，不存在的站点为 -1
+    def index(self, names):
+        return pd.Index(self.names).get_indexer(names)
+
+    # 站点介数与边介数（networkx，无权最短路）
+    def betweenness(self):
+        import networkx as nx
+        G = nx.Graph()
+        G.add_nodes_from(range(len(self)))
+        G.add_edges_from(zip(self.edge_u.tolist(), self.edge_v.tolist()))
+        node = nx.betweenness_centrality(G)
+        edge = nx.edge_betweenness_centrality(G)
+        edge_score = np.array([edge[(u, v)] if (u, v) in edge else edge[(v, u)]
+                               for u, v in zip(self.edge_u.tolist(), self.edge_v.tolist())])
+        return np.array([node[i] for i in range(len(self))]), edge_score
+
+    # OD 需求沿最短路分配后的站点、边客流：demand 为 站点 × 站点 的需求矩阵
+    # 所有起点的最短路树同时处理，按到起点的距离从远到近，把每个站点的客流累加到其前驱站点
+    # 累加后 flow[s, s] 为起点 s 的全部进站客流，flow[s, v] 为从 s 出发、在 v 出站或途经 v 的客流，站点客流为各起点之和
+    def od_load(self, demand):
+        demand = np.asarray(demand, dtype=float)
+        dist, pred = dijkstra(self.adjacency, directed=False, unweighted=True, return_predecessors=True)
+        flow = demand.copy()
+        np.fill_diagonal(flow, 0)
+        level = np.where(np.isfinite(dist), dist, -1).astype(int)
+        for k in range(level.max(), 0, -1):
+            s, v = np.nonzero(level == k)
+            np.add.at(flow, (s, pred[s, v]), flow[s, v])
+        s, v = np.nonzero(level > 0)
+        edge = np.asarray(self.adjacency[pred[s, v], v]).ravel() - 1
+        edge_load = np.bincount(edge, weights=flow[s, v], minlength=self.n_edges)
+        node_load = flow.sum(axis=0)
+        return node_load, edge_load
+
+
+def read_network(stop_path=STOP_PATH, loop_lines=LOOP_LINES):
+    return Network.from_stops(pd.read_json(stop_path, encoding='utf-8'), loop_lines)
+
+
+# 由出行记录构建 站点 × 站点 的需求矩阵：o、d 为起终点站点名称，不在网络中的站点舍弃，返回 (需求矩阵, 舍弃的出行数)
+def od_demand(network, o, d):
+    o, d = network.index(o), network.index(d)
+    valid = (o >= 0) & (d >= 0)
+    n = len(network)
+    demand = np.bincount(o[valid].astype(np.int64) * n + d[valid], minlength=n * n).reshape(n, n)
+    return demand, int((~valid).sum())
+
+
+# 攻击顺序：target 为 'node'（移除站点）或 'edge'（移除边），按 strategy 的得分从高到低移除，得分相同时随机排列
+# degree：站点的度，边为两端站点度的乘积；betweenness：介数；flow：OD 需求沿最短路分配后的客流，需给定 demand
+# 顺序在攻击开始前一次确定（静态攻击）
+def attack_order(network, strategy, target='node', rng=None, demand=None, betweenness=None):
+    rng = np.random.default_rng(rng)
+    size = len(network) if target == 'node' else network.n_edges
+    if strategy == 'random':
+        return rng.permutation(size)
+    if strategy == 'degree':
+        degree = network.degree()
+        score = degree if target == 'node' else degree[network.edge_u] * degree[network.edge_v]
+    elif strategy == 'betweenness':
+        node_score, edge_score = betweenness if betweenness is not None else network.betweenness()
+        score = node_score if target == 'node' else edge_score
+    elif strategy == 'flow':
+        if demand is None:
+            raise ValueError("客流攻击需要给定 OD 需求矩阵 demand")
+        node_score, edge_score = network.od_load(demand)
+        score = node_score if target == 'node' else edge_score
+    else:
+        raise ValueError(f"未知的攻击策略：{strategy}")
+    return np.lexsort((rng.random(size), -np.asarray(score)))
+
+
+# 按 order 依次移除站点或边，返回每一步移除后的网络指标（长度为 len(order) + 1，第 k 个为移除前 k 个之后）：
+# lcc 为最大连通子图站点数占原站点数的比例，reachability 为仍连通的站点对比例，
+# od_reachability 为仍连通的 OD 需求比例（给定 demand 时），efficiency 为全局效率 Σ1/d_ij / (n(n-1))（efficiency 为 True 时）
+# 从全部移除的状态开始，按相反顺序逐个加回：连通性用并查集合并（按大小合并、路径压缩），
+# 加回一个站点或一条边时，任意两站点间的最短路要么不变、要么经过新加入的站点或边，距离矩阵只需一次 O(n²) 的更新
+def simulate(network, order, target='node', demand=None, efficiency=True):
+    n = len(network)
+    indptr, neighbor = network.adjacency.indptr, network.adjacency.indices
+    parent = np.arange(n)
+    size = np.ones(n, dtype=np.int64)
+    members = [[i] for i in range(n)]
+    if target == 'node':
+        active = np.zeros(n, dtype=bool)
+        largest = 0
+    else:
+        active = np.ones(n, dtype=bool)
+        largest = 1 if n else 0
+    pairs = 0
+    connected_demand = 0.0
+    if demand is not None:
+        demand = np.asarray(demand, dtype=float).copy()
+        np.fill_diagonal(demand, 0)
+        total_demand = demand.sum()
+    if efficiency:
+        dist = np.full((n, n), np.inf, dtype=np.float32)
+        if target == 'edge':
+            np.fill_diagonal(dist, 0)
+
+    def find(i):
+        root = i
+        while parent[root] != root:
+            root = parent[root]
+        while parent[i] != root:
+            parent[i], i = root, parent[i]
+        return root
+
+    def union(i, j):
+        nonlocal largest, pairs, connected_demand
+        a, b = find(i), find(j)
+        if a == b:
+            return
+        if size[a] < size[b]:
+            a, b = b, a
+        pairs += 2 * size[a] * size[b]
+        if demand is not None:
+            ma, mb = members[a], members[b]
+            connected_demand += demand[np.ix_(ma, mb)].sum() + demand[np.ix_(mb, ma)].sum()
+        parent[b] = a
+        size[a] += size[b]
+        members[a].extend(members[b])
+        members[b] = []
+        largest = max(largest, size[a])
+
+    steps = len(order)
+    result = {'lcc': np.zeros(steps + 1), 'reachability': np.zeros(steps + 1)}
+    if demand is not None:
+        result['od_reachability'] = np.zeros(steps + 1)
+    if efficiency:
+        result['efficiency'] = np.zeros(steps + 1)
+
+    def record(k):
+        result['lcc'][k] = largest / n
+        result['reachability'][k] = pairs / (n * (n - 1))
+        if demand is not None:
+            result['od_reachability'][k] = connected_demand / total_demand if total_demand > 0 else 0
+        if efficiency:
+            with np.errstate(divide='ignore'):
+                inverse = 1 / dist
+            inverse[~np.isfinite(inverse)] = 0
+            result['efficiency'][k] = inverse.sum(dtype=float) / (n * (n - 1))
+
+    record(steps)
+    for k in range(steps - 1, -1, -1):
+        if target == 'node':
+            v = order[k]
+            active[v] = True
+            largest = max(largest, 1)
+            nb = neighbor[indptr[v]:indptr[v + 1]]
+            nb = nb[active[nb]]
+            for u in nb:
+                union(v, u)
+            if efficiency:
+                # 新站点到各站点的距离为到其相邻站点的最短距离 + 1，再用经过新站点的路径更新其余站点对
+                dv = dist[nb].min(axis=0) + 1 if len(nb) else np.full(n, np.inf, dtype=np.float32)
+                dv[v] = 0
+                dist[v], dist[:, v] = dv, dv
+                np.minimum(dist, dv[:, None] + dv[None, :], out=dist)
+        else:
+            u, v = network.edge_u[order[k]], network.edge_v[order[k]]
+            union(u, v)
+            if efficiency:
+                du, dv = dist[:, u].copy(), dist[:, v].copy()
+                np.minimum(dist, du[:, None] + 1 + dv[None, :], out=dist)
+                np.minimum(dist, dv[:, None] + 1 + du[None, :], out=dist)
+        record(k)
+    result['removed'] = np.arange(steps + 1) / steps if steps else np.zeros(1)
+    return result
+
+
+# 鲁棒性指标 R：移除过程中最大连通子图比例的平均值（Schneider 等），越大越鲁棒；随机攻击取各次重复的平均
+def robustness_index(result):
+    return float(np.asarray(result['lcc'])[..., 1:].mean())
+
+
+# 每个进程初始化时保存一次网络与需求矩阵，之后各次随机攻击复用
+_network = None
+_demand = None
+
+
+def _init_worker(network, demand):
+    global _network, _demand
+    _network, _demand = network, demand
+
+
+def _random_replicate(task):
+    seed, target, efficiency = task
+    order = attack_order(_network, 'random', target, rng=np.random.default_rng(seed))
+    return simulate(_network, order, target, _demand, efficiency)
+
+
+# 随机攻击的多次重复：各次重复的随机种子由 seed 派生，结果与进程数无关；processes 大于 1 时分配到进程池计算
+# 返回 dict，各指标为 重复次数 × (步数 + 1) 的数组
+def random_attack(network, replicates=REPLICATES, target='node', demand=None, efficiency=True, seed=SEED,
+                  processes=1):
+    tasks = [(s, target, efficiency) for s in np.random.SeedSequence(seed).spawn(replicates)]
+    if processes == 1:
+        _init_worker(network, demand)
+        results = [_random_replicate(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker,
+                                 initargs=(network, demand)) as executor:
+            results = list(executor.map(_random_replicate, tasks, chunksize=max(1, replicates // (4 * processes))))
+    return {key: np.vstack([r[key] for r in results]) for key in results[0]}
+
+
+# 各攻击策略的指标曲线汇总为长表：strategy、removed 及各指标；随机攻击取各次重复的平均值，另给出标准差
+def curve_table(curves):
+    tables = []
+    for strategy, result in curves.items():
+        table = {'strategy': strategy}
+        for key, value in result.items():
+            value = np.asarray(value)
+            if value.ndim == 2:
+                table[key] = value.mean(axis=0)
+                if key != 'removed':
+                    table[key + '_std'] = value.std(axis=0)
+            else:
+                table[key] = value
+        tables.append(pd.DataFrame(table))
+    return pd.concat(tables, ignore_index=True)